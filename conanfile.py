@@ -2,12 +2,214 @@
 # -*- coding: future_fstrings -*-
 # -*- coding: utf-8 -*-
 
-import os, shutil, re, platform, glob
+import os, shutil, re, platform, glob, json, hashlib, tempfile, time, functools, subprocess
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
 from conans import ConanFile, CMake, tools
 from conans.model.version import Version
 from conans.errors import ConanException
 import conans.client.build.compiler_flags as cf
 
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where we don't report the peak RSS
+    resource = None
+
+
+# Direct dependencies between the MRPT libraries (mrpt-<name>), the modules
+# option is expanded to its closure over this.  Note that the pose classes
+# live in mrpt-base.
+MRPT_MODULE_DEPS = {
+    'base':         [],
+    'comms':        ['base'],
+    'opengl':       ['base'],
+    'gui':          ['opengl'],
+    'obs':          ['opengl'],
+    'graphs':       ['opengl'],
+    'maps':         ['obs', 'graphs'],
+    'topography':   ['obs'],
+    'bayes':        ['base'],
+    'tfest':        ['base'],
+    'scanmatching': ['base'],
+    'vision':       ['obs'],
+    'kinematics':   ['opengl'],
+    'hwdrivers':    ['comms', 'maps', 'vision', 'gui'],
+    'slam':         ['maps', 'vision', 'bayes', 'tfest'],
+    'nav':          ['maps', 'graphs', 'kinematics'],
+    'reactivenav':  ['maps'],
+    'detectors':    ['vision', 'maps', 'gui'],
+    'graphslam':    ['slam', 'gui'],
+    'hmtslam':      ['slam'],
+    'pbmap':        ['maps', 'graphs'],
+}
+
+# The MRPT library using each of our requirements, for the package's
+# components.  Anything not listed here (or a library that wasn't built)
+# goes to base, which everything depends on
+MRPT_MODULE_REQUIREMENTS = {
+    'opengl': ['freeglut', 'assimp'],
+    'maps':   ['pcl', 'flann', 'vtk'],
+    'gui':    ['qt'],
+}
+
+
+# Hooks appended to MRPT's top level CMakeLists.txt (so that all the targets
+# exist when they run.)  They do nothing unless the CONAN_MRPT_* variables are
+# defined, see MrptConan._set_up_cmake
+CMAKE_HOOKS = '''
+# Added by conan: compile the heavy MRPT targets in their own job pool
+if(CONAN_MRPT_HEAVY_JOB_POOL)
+  foreach(t ${CONAN_MRPT_HEAVY_TARGETS})
+    if(TARGET ${t})
+      set_property(TARGET ${t} PROPERTY JOB_POOL_COMPILE ${CONAN_MRPT_HEAVY_JOB_POOL})
+    endif()
+  endforeach()
+endif()
+
+# Added by conan: precompiled headers for compilers MRPT only does this for
+# MSVC.  Uses MRPT's own <lib>-precomp.h headers, requires CMake 3.16
+if(CONAN_MRPT_PRECOMPILED_HEADERS AND COMMAND target_precompile_headers)
+  file(GLOB _conan_pch_headers "${CMAKE_SOURCE_DIR}/libs/*/src/*-precomp.h")
+  foreach(pch ${_conan_pch_headers})
+    get_filename_component(lib "${pch}" NAME_WE)
+    string(REPLACE "-precomp" "" lib "${lib}")
+    if(TARGET mrpt-${lib})
+      target_precompile_headers(mrpt-${lib} PRIVATE "${pch}")
+    endif()
+  endforeach()
+endif()
+
+# Added by conan: link the (static, PIC) MRPT libraries into a single libmrpt
+# shared library.  CMake carries the static libraries' own dependencies over
+# to the combined library's link line
+if(CONAN_MRPT_SINGLE_LIBRARY)
+  set(_conan_mrpt_libs)
+  foreach(t ${CONAN_MRPT_SINGLE_LIBRARY_TARGETS})
+    if(TARGET ${t})
+      list(APPEND _conan_mrpt_libs ${t})
+    endif()
+  endforeach()
+  set(_conan_mrpt_src "${CMAKE_BINARY_DIR}/conan_mrpt_single_library.cpp")
+  if(NOT EXISTS "${_conan_mrpt_src}")
+    file(WRITE "${_conan_mrpt_src}" "// Added by conan, everything comes from the MRPT static libraries\n")
+  endif()
+  add_library(conan-mrpt-single SHARED "${_conan_mrpt_src}")
+  set_target_properties(conan-mrpt-single PROPERTIES OUTPUT_NAME mrpt)
+  target_link_libraries(conan-mrpt-single PRIVATE -Wl,--whole-archive ${_conan_mrpt_libs} -Wl,--no-whole-archive)
+  install(TARGETS conan-mrpt-single LIBRARY DESTINATION lib)
+endif()
+'''
+
+
+class FindPackageRule(object):
+    """
+    A rewrite rule for MRPTConfig.cmake (see MrptConan._fixFindPackage)
+
+    @param name Name of the rule in the report
+    @param pattern Regular expression to replace, named groups are passed on
+           to the replacement
+    @param replace Either a %-format string, formatted with the named groups
+           (and source_folder/package_folder), or a callable taking the recipe
+           and the named groups
+    @param warning Warning if the pattern isn't found, None if it's optional
+    @param max_version Latest MRPT version the rule applies to
+    """
+
+    def __init__(self, name, pattern, replace, warning=None, max_version=None):
+        self.name        = name
+        self.regex       = re.compile(pattern)
+        self.pattern     = pattern
+        self.replace     = replace
+        self.warning     = warning
+        self.max_version = max_version
+
+    def applies_to(self, version):
+        return self.max_version is None or Version(str(version)) <= self.max_version
+
+
+# Present in the newer scripts, which locate themselves
+FIND_PACKAGE_CONFIG_PATH       = re.compile(r'get_filename_component.THIS_MRPT_CONFIG_PATH "..CMAKE_CURRENT_LIST_FILE." PATH.')
+# ..otherwise the build/package path is hardcoded
+FIND_PACKAGE_MRPT_DIR_FALLBACK = re.compile(r'SET.MRPT_DIR "(?P<base>.*?)(?P<type>(build|package))(?P<rest>.*?(?="))')
+
+_CONAN_PATH = r'(?P<CONAN_ROOT>(?P<base>.*?).(?P<type>(build|package)).(?P<hash>\w+).)(?P<rest>.*?(?="))'
+
+FIND_PACKAGE_RULES = [
+    FindPackageRule('config_path', FIND_PACKAGE_CONFIG_PATH.pattern, 'set(THIS_MRPT_CONFIG_PATH ${CONAN_MRPT_ROOT})'),
+
+    # Source isn't installed, so no real point in fixing this..
+    FindPackageRule('source_dir', r'SET.MRPT_SOURCE_DIR "(.*)".', 'SET(MRPT_SOURCE_DIR "%(source_folder)s")', max_version='2'),
+
+    FindPackageRule('libs_incl_dir', r'SET.MRPT_LIBS_INCL_DIR "' + _CONAN_PATH + r'".',
+        lambda recipe, g: recipe._fix_libs_incl_dir(g),
+        'Could not repair MRPT_LIBS_INCL_DIR variable', max_version='2'),
+
+    FindPackageRule('config_dir', r'SET.MRPT_CONFIG_DIR "' + _CONAN_PATH + r'".',
+        lambda recipe, g: recipe._fix_config_dir(g),
+        'Could not repair MRPT_CONFIG_DIR variable', max_version='2'),
+
+    FindPackageRule('mrpt_dir', r'SET.MRPT_DIR "' + _CONAN_PATH + r'".', 'SET(MRPT_DIR "${CONAN_MRPT_ROOT}")', max_version='2'),
+
+    FindPackageRule('eigen_include', r'INCLUDE_DIRECTORIES\("(?P<path>.*?eigen[^"]+)"\)',
+        'list(APPEND MRPT_INCLUDE_DIRS "${CONAN_INCLUDE_DIRS_EIGEN}")',
+        'Could not repair reference to Eigen include directory', max_version='2'),
+
+    FindPackageRule('config_dir_include', r'INCLUDE_DIRECTORIES\(\${MRPT_CONFIG_DIR}\)',
+        'list(APPEND MRPT_INCLUDE_DIRS "${MRPT_CONFIG_DIR}")',
+        'Could not repair reference to MRPT CONFIG directory', max_version='2'),
+
+    FindPackageRule('empty_link_directories', r'(?P<all>LINK_DIRECTORIES\(""\))', '# %(all)s',
+        'Could not comment out empty link_directories directive', max_version='2'),
+
+    # Note: We may want to replace this with a Conan package for
+    # SuiteSparse in the future, especially considering by default
+    # this points at the wrong place anyways.
+    FindPackageRule('suitesparse_include', r'INCLUDE_DIRECTORIES\("(?P<suitesparse>[^"]+)"\) # SuiteSparse\w+',
+        'list(APPEND MRPT_INCLUDE_DIRS "%(suitesparse)s") # SuiteSparse_INCLUDE_DIRS',
+        'Could not repair reference to SuiteSparse directory', max_version='2'),
+
+    FindPackageRule('mrpt_include', r'INCLUDE_DIRECTORIES\("(?P<path>\${MRPT_LIBS_INCL_DIR}/\${MRPTLIB}/include)"\)',
+        'list(APPEND MRPT_INCLUDE_DIRS "%(path)s")',
+        'Could not repair reference to MRPT include directory', max_version='2'),
+
+    FindPackageRule('wxwidgets_link', r'(?=\w)LINK_DIRECTORIES\(\${wxWidgets_LIBRARY_DIRS}\)',
+        'list(APPEND MRPT_INCLUDE_DIRS "${wxWidgets_LIBRARY_DIRS}")',
+        'Could not repair the link to wxWidget', max_version='2'),
+
+    FindPackageRule('duplicate_lib_link', r'(?P<first>LINK_DIRECTORIES\("/lib"\))\s+LINK_DIRECTORIES\("/lib"\)', '%(first)s',
+        'Could not remove the duplicate link directories', max_version='2'),
+
+    FindPackageRule('mrpt_link', r'LINK_DIRECTORIES\((?P<lib>\${MRPT_DIR}/lib)\)',
+        'list(APPEND MRPT_LINK_DIRECTORIES "%(lib)s")',
+        'Could not repair link to MRPT libs', max_version='2'),
+]
+
+
+@functools.lru_cache(maxsize=8)
+def _compile_find_package_rules(patterns):
+    """
+    Combine rule patterns into a single regular expression, each wrapped in a
+    group named r<index>, and with its own groups prefixed with r<index>_
+    """
+
+    alternatives = []
+    for i, p in enumerate(patterns):
+        p = re.sub(r'\(\?P<(\w+)>', f'(?P<r{i}_\\1>', p)
+        p = re.sub(r'\(\?P=(\w+)\)', f'(?P=r{i}_\\1)', p)
+        alternatives.append(f'(?P<r{i}>{p})')
+    return re.compile('|'.join(alternatives))
+
+
+def profiled(method):
+    """ Record the resources used by a recipe method, see MrptConan._profile_phase """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._profile_phase(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 class MrptConan(ConanFile):
     """
@@ -19,6 +221,12 @@ class MrptConan(ConanFile):
     url         = 'http://www.mrpt.org/'
     description = 'The Mobile Robot Programming Toolkit (MRPT) '
     settings    = 'os', 'compiler', 'build_type', 'arch', 'arch_build'
+    exports_sources = 'pgo/*'
+
+    # The source tree is patched identically for every configuration (see
+    # _source_patches), so build straight out of it rather than copying it
+    # into every build folder
+    no_copy_source = True
     requires    = (
         'eigen/[>=3.2.0]@ntc/stable',
         'freeglut/[>=3.0.0]@ntc/stable',
@@ -26,7 +234,6 @@ class MrptConan(ConanFile):
         'zlib/[>=1.2.11]@conan/stable',
         'flann/[>=1.6.8]@ntc/stable',
         'boost/[>1.46]@ntc/stable',
-        'libjpeg/9b@lasote/stable', # Doesn't seem to actually be used (at least not linked to), and libjpeg is in the system reqs
         'helpers/0.3@ntc/stable',
     )
 
@@ -39,6 +246,27 @@ class MrptConan(ConanFile):
         'with_qt':     [True, False],
         'with_vtk':    [True, False],
         'with_assimp': [True, False],
+        'compiler_cache': ['none', 'ccache', 'sccache'],
+        'reuse_configure': [True, False],
+        'generator':       ['auto', 'Ninja', 'default'],
+        'unity_build':         [True, False],
+        'precompiled_headers': [True, False],
+        'modules':             'ANY',
+        'simd':                ['sse2', 'sse4', 'avx2', 'avx512', 'native'],
+        'lto':                 [True, False],
+        'pgo':                 [True, False],
+        # split leaves the debug info out of the package, for the mrpt-debug
+        # companion package (see _strip_debug_info)
+        'debug_info':          ['none', 'split', 'embedded'],
+        # hidden only hides the inline functions (-fvisibility-inlines-hidden)
+        # for every version we build: MRPT <2.0 only marks its API for export
+        # on Windows, so -fvisibility=hidden would hide the whole API
+        'symbol_visibility':   ['default', 'hidden'],
+        'fast_linking':        [True, False],
+        'single_library':      [True, False],
+        'parallel_backend':    ['none', 'openmp', 'tbb'],
+        'jpeg_backend':        ['libjpeg', 'libjpeg-turbo', 'system'],
+        'release_compatible':  [True, False],
     }
     default_options = (
         'shared=True',
@@ -49,6 +277,22 @@ class MrptConan(ConanFile):
         'with_qt=False',
         'with_vtk=False',
         'with_assimp=False',
+        'compiler_cache=none',
+        'reuse_configure=True',
+        'generator=auto',
+        'unity_build=False',
+        'precompiled_headers=False',
+        'modules=all',
+        'simd=sse2',
+        'lto=False',
+        'pgo=False',
+        'debug_info=embedded',
+        'symbol_visibility=default',
+        'fast_linking=False',
+        'single_library=False',
+        'parallel_backend=openmp',
+        'jpeg_backend=libjpeg',
+        'release_compatible=False',
     )
 
     def requirements(self):
@@ -68,6 +312,16 @@ class MrptConan(ConanFile):
         if self.options.with_qt:
             self.requires('qt/[>=5.3.2]@ntc/stable')
 
+        if 'tbb' == self.options.parallel_backend:
+            self.requires('tbb/[>=4.4]@ntc/stable')
+
+        # libjpeg-turbo has the same API (and ABI), the system one is found
+        # by MRPT itself (libjpeg-dev is in the system requirements)
+        if 'libjpeg' == self.options.jpeg_backend:
+            self.requires('libjpeg/9b@lasote/stable')
+        elif 'libjpeg-turbo' == self.options.jpeg_backend:
+            self.requires('libjpeg-turbo/[>=1.5.2]@bincrafters/stable')
+
         if self.options.with_pcl:
             # Suddenly MRPT 1.2.2 no longer builds on Windows claiming an ambiguous
             # type PointT in PbMapMaker.cpp.  As we don't use PCL MRPT functions
@@ -78,10 +332,82 @@ class MrptConan(ConanFile):
             else:
                 self.requires('pcl/[>=1.7.0]@ntc/stable')
 
+    def configure(self):
+        # Validate the modules option early, rather than at build time
+        self._mrpt_modules
+
+        if self._single_library and not self.options.shared:
+            raise ConanException('The single_library option builds a shared libmrpt, it requires shared=True')
+
+        if 'tbb' == self.options.parallel_backend and Version(str(self.version)) < '1.4.0':
+            raise ConanException(f'MRPT {self.version} cannot use TBB (MRPT >=1.4.0 can), use parallel_backend=openmp or none')
+        if 'openmp' == self.options.parallel_backend and 'apple-clang' == self.settings.compiler:
+            raise ConanException('apple-clang does not support OpenMP, use parallel_backend=tbb or none')
+
     def config_options(self):
         if 'Visual Studio' == self.settings.compiler:
             self.options.remove('fPIC')
-
+            # Only implemented for the gcc/clang profile instrumentation
+            self.options.remove('pgo')
+            # MSVC exports nothing by default anyway
+            self.options.remove('symbol_visibility')
+        if self.settings.arch not in ['x86', 'x86_64']:
+            self.options.remove('simd')
+        if 'apple-clang' == self.settings.compiler:
+            # No OpenMP
+            self.options.parallel_backend = 'none'
+        if self.settings.os in ['Windows', 'Macos']:
+            # Only implemented for ELF (objcopy), not PDBs or dSYMs
+            self.options.remove('debug_info')
+            # GNU ld flags
+            self.options.remove('fast_linking')
+            self.options.remove('single_library')
+
+    def package_id(self):
+        # The compiler cache only changes how fast we get the objects, not
+        # the objects themselves
+        del self.info.options.compiler_cache
+        del self.info.options.reuse_configure
+        del self.info.options.generator
+        del self.info.options.unity_build
+        del self.info.options.precompiled_headers
+
+        # Neither does the machine we build on, nor whether we ran the tests
+        # (they aren't packaged)
+        del self.info.settings.arch_build
+        del self.info.options.build_tests
+
+        # Spelling of the modules list shouldn't matter, only what gets built
+        modules = self._mrpt_modules
+        self.info.options.modules = 'all' if modules is None else ','.join(sorted(modules))
+
+        # A patch release of a requirement doesn't need a new MRPT, and the
+        # requirements' own dependencies (opencv's, pcl's, ..) don't affect
+        # our binary at all.  Except for the ones whose ABI (or, for Eigen,
+        # inlined code) changes with every minor release, their sonames say
+        # as much
+        self.info.requires.semver_direct_mode()
+        minor = ['boost', 'opencv', 'eigen']
+        if self.options.with_vtk: minor.append('vtk')
+        if self.options.with_pcl: minor.append('pcl')
+        for r in minor:
+            self.info.requires[r].minor_mode()
+
+        # Recipe time python helpers, nothing of theirs ends up in the binary
+        self.info.requires['helpers'].unrelated_mode()
+
+        # Only asks for the fallback, it doesn't change the binary
+        release_compatible = self.options.release_compatible
+        del self.info.options.release_compatible
+
+        # Let RelWithDebInfo consumers that ask for it use a Release binary,
+        # when this conan has compatible packages
+        if release_compatible and 'RelWithDebInfo' == self.settings.build_type and hasattr(self, 'compatible_packages'):
+            compatible = self.info.clone()
+            compatible.settings.build_type = 'Release'
+            self.compatible_packages.append(compatible)
+
+    @profiled
     def source(self):
         ext = 'tar.gz'
         archive=f'{self.version}.{ext}'
@@ -94,15 +420,112 @@ class MrptConan(ConanFile):
             '1.2.2': '074cc4608515927811dec3d0744c75b6',
         }
 
-        local_copy = os.path.join('/tmp', f'mrpt-{archive}')
-        if os.path.exists(local_copy):
-            shutil.copy(local_copy, os.path.join(self.source_folder, archive))
-        else:
-            tools.download(url=archive_url, filename=archive)
-            tools.check_md5(archive, hashes[self.version])
+        root = os.path.join(self.source_folder, self.name)
+        if self._source_patches_state(root) == 'current':
+            self.output.info('MRPT source tree is already extracted and patched')
+            return
+
+        tree = self._cached_source_tree(archive=archive, url=archive_url, md5=hashes[self.version])
+        with self._profile_phase('link_tree'):
+            self._link_tree(src=tree, dst=root)
+
+        self._apply_source_patches(root)
+
+    @property
+    def _source_patches(self):
+        """
+        Patches applied to the MRPT source tree, as (name, fingerprint, apply)
+        tuples.  As the tree is shared by every configuration
+        (no_copy_source), these can't depend on the options or dependencies:
+        those are applied at build time instead (see _build_patches and
+        _cmake_source_dir.)
+
+        The fingerprint identifies the content of a patch, so that changing a
+        patch invalidates trees patched with the old version.
+        """
+
+        root = os.path.join(self.source_folder, self.name)
+
+        def append_hooks():
+            with open(os.path.join(root, 'CMakeLists.txt'), 'a') as f: f.write(CMAKE_HOOKS)
+
+        # C1027 error
+        zm300_replace = {'file_path': 'CMakeLists.txt', 'search': '/Zm1000', 'replace': '/Zm300'}
+
+        def zm300():
+            tools.replace_in_file(**dict(zm300_replace, file_path=os.path.join(root, zm300_replace['file_path'])))
+
+        return [
+            ('cmake_hooks', CMAKE_HOOKS, append_hooks),
+            ('zm300', json.dumps(zm300_replace, sort_keys=True), zm300),
+        ]
+
+    @staticmethod
+    def _source_patches_file(root):
+        return os.path.join(root, '.conan_patches.json')
+
+    def _source_patches_state(self, root):
+        """
+        Compare the patches recorded in the source tree with _source_patches
 
-        tools.unzip(archive)
-        shutil.move(f'mrpt-{self.version}', self.name)
+        @return 'current' if all of them are applied, 'missing' if some still
+                have to be, or 'stale' if the tree was patched differently and
+                needs to be extracted again
+        """
+
+        path = self._source_patches_file(root)
+        if not os.path.exists(path):
+            return 'stale' if os.path.exists(root) else 'missing'
+        with open(path) as f: applied = json.load(f)
+
+        wanted = {name: hashlib.sha1(fingerprint.encode('utf-8')).hexdigest() for name, fingerprint, _ in self._source_patches}
+        if any(wanted.get(name) != digest for name, digest in applied.items()):
+            return 'stale'
+        return 'current' if applied == wanted else 'missing'
+
+    def _apply_source_patches(self, root):
+        """ Apply the patches of _source_patches not already recorded in the tree """
+
+        path = self._source_patches_file(root)
+        applied = {}
+        if os.path.exists(path):
+            with open(path) as f: applied = json.load(f)
+
+        for name, fingerprint, apply in self._source_patches:
+            digest = hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
+            if applied.get(name) == digest:
+                continue
+            self.output.info(f'Applying source patch {name}')
+            apply()
+            applied[name] = digest
+
+            # Record as we go, so an interrupted source() doesn't re-apply
+            with open(path, 'w') as f: json.dump(applied, f, indent=2, sort_keys=True)
+
+    def _check_source_patches(self):
+        """
+        Make sure the (shared) source tree has the patches of this recipe.
+        None of them depend on the configuration, so this only fails on a
+        tree patched by another revision of the recipe, or an interrupted
+        source()
+        """
+
+        state = self._source_patches_state(os.path.join(self.source_folder, self.name))
+        if state != 'current':
+            raise ConanException(
+                f'The MRPT source tree does not have the patches of this recipe ({state}).  '
+                'Remove the source folder to have it extracted again.'
+            )
+
+    def _build_patches(self, cmake):
+        """
+        The patches that depend on the configuration.  As the source tree is
+        shared, these are injected through CMake rather than edited into it.
+
+        @param cmake CMake object whose definitions to update
+        """
+
+        project_include = []
 
         if 'vtk' in self.deps_cpp_info.deps:
             vtk_release = int(self.deps_cpp_info['vtk'].version.split('.')[0])
@@ -113,22 +536,232 @@ class MrptConan(ConanFile):
                 # seem to build without VTK or this dependency.  I don't recall
                 # seeing this after VTK v7 though.
                 self.output.info('Injecting a find_package(Qt5Widgets) due to VTK 6')
-                file = os.path.join(self.name, 'cmakemodules/DeclareMRPTLib.cmake')
-                with open(file) as f: data = f.read()
-                data = 'find_package(Qt5Widgets)\n\n' + data
-                with open(file, 'w') as f: f.write(data)
+                project_include.append('find_package(Qt5Widgets)')
 
-        # C1027 error
-        tools.replace_in_file(
-            file_path=os.path.join(self.name, 'CMakeLists.txt'),
-            search='/Zm1000',
-            replace='/Zm300',
-        )
+        if project_include:
+            # Included by CMake right after MRPT's project() call
+            path = os.path.join(self.build_folder, 'conan_mrpt_project_include.cmake')
+            with open(path, 'w') as f: f.write('\n'.join(project_include) + '\n')
+            cmake.definitions['CMAKE_PROJECT_MRPT_INCLUDE:FILEPATH'] = path
 
-        if self.settings.compiler == 'gcc':
-            import cmake_helpers
-            cmake_helpers.wrapCMakeFile(os.path.join(self.source_folder, self.name), output_func=self.output.info)
+    def _cmake_source_dir(self):
+        """
+        The folder to configure MRPT from.  Normally the (shared) MRPT source
+        tree, but gcc builds wrap MRPT's CMakeLists.txt with the helpers
+        package, which edits it in place.  So for those, the top level of the
+        tree is mirrored in the build folder (symlinks to everything but
+        CMakeLists.txt) and the copy is wrapped instead.
+        """
 
+        source_dir = os.path.join(self.source_folder, self.name)
+        if self.settings.compiler != 'gcc':
+            return source_dir
+
+        wrapper_dir = os.path.join(self.build_folder, 'mrpt_source_wrapper')
+        if os.path.exists(wrapper_dir):
+            shutil.rmtree(wrapper_dir)
+        os.makedirs(wrapper_dir)
+
+        for name in os.listdir(source_dir):
+            src = os.path.join(source_dir, name)
+            dst = os.path.join(wrapper_dir, name)
+            if name == 'CMakeLists.txt':
+                shutil.copy2(src, dst)
+                continue
+            try:
+                os.symlink(src, dst, target_is_directory=os.path.isdir(src))
+            except OSError:
+                # e.g. Windows without the symlink privilege (MinGW)
+                if os.path.isdir(src):
+                    shutil.copytree(src, dst, symlinks=True)
+                else:
+                    shutil.copy2(src, dst)
+
+        import cmake_helpers
+        with self._profile_phase('wrapCMakeFile'):
+            cmake_helpers.wrapCMakeFile(wrapper_dir, output_func=self.output.info)
+
+        return wrapper_dir
+
+    @property
+    def source_cache_dir(self):
+        """
+        Content-addressable cache of the MRPT source archives (and their
+        extracted trees), keyed by the archive's md5.  Can be overridden with
+        the MRPT_SOURCE_CACHE_DIR environment variable.
+        """
+
+        default = os.path.join(os.path.expanduser('~'), '.cache', 'conan-mrpt', 'sources')
+        return os.environ.get('MRPT_SOURCE_CACHE_DIR', default)
+
+    def _cached_source_tree(self, archive, url, md5):
+        """
+        Get the extracted MRPT source tree from the source cache, populating
+        the cache if required.  An archive is only verified once, when it
+        enters the cache.  The tree is checked against the manifest taken
+        when it was extracted every time it's used, as the source folders
+        may be hardlinked to it (see _link_tree), and extracted again if
+        anything changed.
+
+        @param archive File name of the archive
+        @param url URL to download the archive from
+        @param md5 Expected md5 of the archive, also used as the cache key
+        @return Path to the (pre-extracted) source tree in the cache
+        """
+
+        entry = os.path.join(self.source_cache_dir, md5)
+        cached_archive = os.path.join(entry, archive)
+        verified = os.path.join(entry, 'verified')
+        tree = os.path.join(entry, 'tree')
+        manifest = os.path.join(entry, 'tree.json')
+
+        if not os.path.isdir(entry):
+            os.makedirs(entry)
+
+        if os.path.exists(verified) and os.path.isdir(tree) and self._tree_matches_manifest(tree, manifest):
+            self.output.info(f'Using cached MRPT source tree {tree}')
+        else:
+            if os.path.isdir(tree):
+                self.output.warn(f'The cached MRPT source tree {tree} was modified, extracting it again')
+                shutil.rmtree(tree)
+
+            if os.path.exists(verified) and os.path.exists(cached_archive):
+                self.output.info(f'Using cached MRPT archive {cached_archive}')
+            else:
+                partial = cached_archive + '.part'
+
+                # Archives pre-seeded in /tmp (e.g. on offline agents) are
+                # still accepted, but verified like any download
+                local_copy = os.path.join('/tmp', f'mrpt-{archive}')
+                with self._profile_phase('download'):
+                    if os.path.exists(local_copy):
+                        shutil.copy(local_copy, partial)
+                    else:
+                        tools.download(url=url, filename=partial)
+                    tools.check_md5(partial, md5)
+                os.replace(partial, cached_archive)
+                with open(verified, 'w') as f: f.write(md5)
+
+            # Extract to a staging directory and rename into place, so that a
+            # concurrent or interrupted source() never sees a partial tree
+            staging = tempfile.mkdtemp(dir=entry)
+            try:
+                with self._profile_phase('unzip'):
+                    tools.unzip(cached_archive, destination=staging)
+                if not os.path.isdir(tree):
+                    extracted = os.path.join(staging, f'mrpt-{self.version}')
+                    with open(os.path.join(staging, 'tree.json'), 'w') as f:
+                        json.dump(self._tree_manifest(extracted), f, sort_keys=True)
+                    os.replace(os.path.join(staging, 'tree.json'), manifest)
+                    os.rename(extracted, tree)
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+
+        # Mark the entry as recently used
+        os.utime(entry, None)
+        self._prune_source_cache(keep=entry)
+
+        return tree
+
+    def _prune_source_cache(self, keep):
+        """
+        Evict the least recently used entries of the source cache until it is
+        under MRPT_SOURCE_CACHE_MAX_MB (default 4096)
+
+        @param keep Cache entry that must not be evicted (the one in use)
+        """
+
+        max_size = int(os.environ.get('MRPT_SOURCE_CACHE_MAX_MB', 4096)) * 1024 * 1024
+
+        def entry_size(path):
+            size = 0
+            inodes = set()
+            for root, _, files in os.walk(path):
+                for name in files:
+                    st = os.lstat(os.path.join(root, name))
+                    if st.st_ino not in inodes:
+                        inodes.add(st.st_ino)
+                        size += st.st_size
+            return size
+
+        entries = [os.path.join(self.source_cache_dir, e) for e in os.listdir(self.source_cache_dir)]
+        entries = sorted((e for e in entries if os.path.isdir(e)), key=os.path.getmtime)
+        sizes = {e: entry_size(e) for e in entries}
+        total = sum(sizes.values())
+
+        for e in entries:
+            if total <= max_size:
+                break
+            if e == keep:
+                continue
+            self.output.info(f'Evicting {e} from the MRPT source cache')
+            shutil.rmtree(e, ignore_errors=True)
+            total -= sizes[e]
+
+    @staticmethod
+    def _tree_manifest(root):
+        """ sha1 of every file under root (the target of symlinks), by path relative to root """
+
+        manifest = {}
+        for dirpath, _, files in os.walk(root):
+            for name in files:
+                path = os.path.join(dirpath, name)
+                rel = os.path.relpath(path, root).replace(os.sep, '/')
+                if os.path.islink(path):
+                    manifest[rel] = 'link:' + os.readlink(path)
+                    continue
+                sha1 = hashlib.sha1()
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b''):
+                        sha1.update(chunk)
+                manifest[rel] = sha1.hexdigest()
+        return manifest
+
+    def _tree_matches_manifest(self, tree, manifest):
+        """ Whether the cached tree is still what was extracted, see _cached_source_tree """
+
+        if not os.path.exists(manifest):
+            return False
+        with open(manifest) as f: expected = json.load(f)
+        with self._profile_phase('verify_tree'):
+            return self._tree_manifest(tree) == expected
+
+    @staticmethod
+    def _link_tree(src, dst):
+        """
+        Populate dst from the cached tree src with reflinks (copy on write,
+        on btrfs, XFS, ...) if the file system supports them, or else
+        hardlinks rather than copies (falling back to a copy across file
+        systems.)  The CMake files are always copied, as those are what we
+        patch in place, and patching a hardlink would corrupt the cache.
+        Anything else edited in dst changes the cache too, which
+        _cached_source_tree catches the next time it's used.
+        """
+
+        if os.path.exists(dst):
+            shutil.rmtree(dst)
+
+        try:
+            if 0 == subprocess.call(['cp', '-a', '--reflink=always', src, dst], stderr=subprocess.DEVNULL):
+                return
+        except OSError:
+            # No (GNU) cp, e.g. on Windows
+            pass
+        if os.path.exists(dst):
+            shutil.rmtree(dst)
+
+        def link_or_copy(s, d):
+            if re.search(r'(CMakeLists\.txt|\.cmake)$', s):
+                return shutil.copy2(s, d)
+            try:
+                os.link(s, d)
+            except OSError:
+                shutil.copy2(s, d)
+            return d
+
+        shutil.copytree(src, dst, symlinks=True, copy_function=link_or_copy)
+
+    @profiled
     def system_requirements(self):
         pack_names = None
         if tools.os_info.linux_distro == "ubuntu":
@@ -159,13 +792,9 @@ class MrptConan(ConanFile):
                 pack_names = full_pack_names
 
         if pack_names:
-            installer = tools.SystemPackageTool()
-            try:
-                installer.update() # Update the package database
-                installer.install(" ".join(pack_names)) # Install the package
-            except ConanException:
-                self.output.warn('Could not install system updates')
+            self._install_system_packages(pack_names, 'system updates')
 
+    @profiled
     def build_requirements(self):
         pack_names = None
         if tools.os_info.linux_distro == "ubuntu":
@@ -178,46 +807,217 @@ class MrptConan(ConanFile):
                 pack_names = full_pack_names
 
         if pack_names:
+            self._install_system_packages(pack_names, 'build requirements')
+
+    @property
+    def system_packages_cache_dir(self):
+        """
+        Where the system package checks that passed are recorded, see
+        _install_system_packages.  Can be overridden with the
+        MRPT_SYSTEM_PACKAGES_CACHE_DIR environment variable.
+        """
+
+        default = os.path.join(os.path.expanduser('~'), '.cache', 'conan-mrpt', 'system_packages')
+        return os.environ.get('MRPT_SYSTEM_PACKAGES_CACHE_DIR', default)
+
+    def _install_system_packages(self, pack_names, what):
+        """
+        Install whichever of the (Debian) packages are missing.  Refreshing
+        the package database and running apt are what's slow, so they're
+        only done when a single dpkg-query of all the packages finds some
+        missing.  Once all the packages are found, that is recorded in
+        system_packages_cache_dir, keyed by the package list and valid
+        until the dpkg database changes.
+
+        @param pack_names Package names, optionally with an :arch suffix
+        @param what What the packages are, for the warning if installing fails
+        """
+
+        key = hashlib.sha1(' '.join(sorted(pack_names)).encode('utf-8')).hexdigest()
+        marker = os.path.join(self.system_packages_cache_dir, key)
+        db_state = self._dpkg_db_state
+        if db_state is not None and os.path.exists(marker):
+            with open(marker) as f:
+                if f.read() == db_state:
+                    self.output.info(f'System packages for the {what} are installed (cached check)')
+                    return
+
+        missing = self._missing_system_packages(pack_names)
+        if missing:
+            self.output.info('Installing missing system packages: %s'%' '.join(missing))
             installer = tools.SystemPackageTool()
             try:
                 installer.update() # Update the package database
-                installer.install(" ".join(pack_names)) # Install the package
+                installer.install(' '.join(missing)) # Install the package
             except ConanException:
-                self.output.warn('Could not install build requirements')
+                self.output.warn(f'Could not install {what}')
+                return
+            missing = self._missing_system_packages(missing)
+
+        db_state = self._dpkg_db_state
+        if not missing and db_state is not None:
+            if not os.path.isdir(self.system_packages_cache_dir):
+                os.makedirs(self.system_packages_cache_dir)
+            with open(marker, 'w') as f: f.write(db_state)
 
-    def _set_up_cmake(self):
+    @staticmethod
+    def _missing_system_packages(pack_names):
+        """
+        Which of the packages aren't installed, from one dpkg-query call
+
+        @param pack_names Package names, optionally with an :arch suffix
+        @return The missing packages (all of them if dpkg-query fails)
+        """
+
+        names = sorted(set(p.split(':')[0] for p in pack_names))
+        try:
+            p = subprocess.run(
+                ['dpkg-query', '--show', '--showformat=${Package} ${Architecture} ${Status}\\n'] + names,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+            )
+        except OSError:
+            return list(pack_names)
+
+        # dpkg-query fails for packages it doesn't know at all, but still
+        # lists the others
+        installed = set()
+        for line in p.stdout.splitlines():
+            fields = line.split()
+            if len(fields) >= 3 and 'installed' == fields[-1]:
+                installed.add((fields[0], fields[1]))
+
+        def is_installed(pack_name):
+            name, _, arch = pack_name.partition(':')
+            return any(n == name and (not arch or a in [arch, 'all']) for n, a in installed)
+
+        return [p for p in pack_names if not is_installed(p)]
+
+    @property
+    def _dpkg_db_state(self):
+        """ Changes whenever a package is installed or removed, None without dpkg """
+
+        try:
+            st = os.stat('/var/lib/dpkg/status')
+        except OSError:
+            return None
+        return f'{st.st_mtime_ns} {st.st_size}'
+
+    def _set_up_cmake(self, pgo_phase='use'):
         """
         Normally this would be in build, but because we often have to
         re-run pacakging (MRPT has been annoying), and packaging is more or
         less done with cmake.install(), we need the CMake object to be
         available to us in both the build() and package() methods
+
+        @param pgo_phase With the pgo option, whether to instrument the
+               build ('generate') or optimize it with the profile ('use')
         """
 
 
-        cmake = CMake(self)
+        cmake = CMake(self, generator=self._cmake_generator)
+        self._build_patches(cmake)
 
-        if 'fPIC' in self.options and self.options.fPIC:
+        if ('fPIC' in self.options and self.options.fPIC) or self._single_library:
             cmake.definitions['CMAKE_POSITION_INDEPENDENT_CODE'] = 'ON'
         if self.options.cxx11:
             cmake.definitions['CMAKE_CXX_STANDARD'] = 11
 
+        cxx_flags = []
         if self.settings.compiler == 'gcc':
-            cmake.definitions['ADDITIONAL_CXX_FLAGS:STRING'] = ' '.join([
+            cxx_flags += [
                 '-frecord-gcc-switches',
                 '-Wno-deprecated-declarations'
-            ])
+            ]
+
+        # Instruction set.  Don't let MRPT autodetect the SSE level from the
+        # builder's CPU, we want the binary to match the option
+        if 'simd' in self.options:
+            native = 'native' == self.options.simd
+            sse4 = native or self.options.simd != 'sse2'
+            cmake.definitions['MRPT_OPTIMIZE_NATIVE:BOOL'] = 'ON' if native else 'OFF'
+            cmake.definitions['MRPT_AUTODETECT_SSE:BOOL']  = 'ON' if native else 'OFF'
+            cmake.definitions['DISABLE_SSE2:BOOL']         = 'OFF'
+            for sse in ['SSE3', 'SSSE3', 'SSE4_1', 'SSE4_2']:
+                cmake.definitions[f'DISABLE_{sse}:BOOL'] = 'OFF' if sse4 else 'ON'
+            cxx_flags += self._simd_flags
+
+        # Eigen's alignment changes with the instruction set, and has to be the
+        # same for MRPT and its consumers (see package_info)
+        align = self._eigen_align_bytes
+        if align is not None:
+            cxx_flags += [f'-DEIGEN_MAX_ALIGN_BYTES={align}', f'-DEIGEN_MAX_STATIC_ALIGN_BYTES={align}']
+
+        if self.options.lto:
+            cmake.definitions['CMAKE_INTERPROCEDURAL_OPTIMIZATION:BOOL'] = 'ON'
+            # MRPT's cmake_minimum_required predates CMP0069, without which
+            # CMake ignores the IPO property for everything but Intel
+            cmake.definitions['CMAKE_POLICY_DEFAULT_CMP0069:STRING'] = 'NEW'
+            if not self.options.shared and self.settings.compiler == 'gcc':
+                # Keep regular objects in the static libs too, so consumers
+                # don't need to link with LTO themselves
+                cxx_flags += ['-ffat-lto-objects']
+
+        linker_flags = []
+        if self._pgo_enabled:
+            pgo_flags = self._pgo_flags(pgo_phase)
+            cxx_flags += pgo_flags
+            linker_flags += pgo_flags
+
+        # Startup time of the consumers.  Every exported symbol is another
+        # entry in the dynamic symbol table, and every call between MRPT
+        # functions another relocation for the loader to resolve.  Only the
+        # inline functions can be hidden, see the symbol_visibility option
+        if 'symbol_visibility' in self.options and 'hidden' == self.options.symbol_visibility:
+            cxx_flags += ['-fvisibility-inlines-hidden']
+        if 'fast_linking' in self.options and self.options.fast_linking:
+            linker_flags += ['-Wl,--as-needed', '-Wl,-Bsymbolic-functions']
+
+        # The split debug info is looked up by build ID, see _strip_debug_info
+        if 'debug_info' in self.options and 'split' == self.options.debug_info:
+            linker_flags += ['-Wl,--build-id']
+
+        if linker_flags:
+            for kind in ['EXE', 'SHARED', 'MODULE']:
+                cmake.definitions[f'CMAKE_{kind}_LINKER_FLAGS:STRING'] = ' '.join(linker_flags)
+
+        if cxx_flags:
+            cmake.definitions['ADDITIONAL_CXX_FLAGS:STRING'] = ' '.join(cxx_flags)
 
         # Reported as unused by cmake, but there is a message from the cmake output to use them
         cmake.definitions['BOOST_DYNAMIC:BOOL']        = 'TRUE' if self.options['boost'].shared else 'FALSE'
         cmake.definitions['BOOST_ROOT:PATH']           = self.deps_cpp_info['boost'].rootpath
         #
 
-        cmake.definitions['BUILD_SHARED_LIBS:BOOL']    = 'TRUE' if self.options.shared else 'FALSE'
+        # With single_library the MRPT libraries are built static, and linked
+        # into libmrpt by CMAKE_HOOKS
+        cmake.definitions['BUILD_SHARED_LIBS:BOOL']    = 'TRUE' if self.options.shared and not self._single_library else 'FALSE'
+        if self._single_library:
+            cmake.definitions['CONAN_MRPT_SINGLE_LIBRARY:BOOL'] = 'ON'
+            cmake.definitions['CONAN_MRPT_SINGLE_LIBRARY_TARGETS:STRING'] = ';'.join(
+                f'mrpt-{m}' for m in self._mrpt_modules_order(self._mrpt_module_deps, self._mrpt_modules)
+            )
         cmake.definitions['BUILD_KINECT:BOOL']         = 'FALSE'
         cmake.definitions['MRPT_HAS_ASIAN_FONTS:BOOL'] = 'FALSE'
         cmake.definitions['BUILD_EXAMPLES:BOOL']       = 'FALSE'
         cmake.definitions['BUILD_TESTING:BOOL']        = 'TRUE' if self.options.build_tests else 'FALSE'
 
+        # Unity build and precompiled headers, see _compile_modes for the
+        # per version fallbacks
+        modes, notes = self._compile_modes()
+        for note in notes:
+            self.output.warn(note)
+        cmake.definitions['CMAKE_UNITY_BUILD:BOOL'] = 'ON' if modes['unity_build'] else 'OFF'
+        if modes['unity_build']:
+            cmake.definitions['CMAKE_UNITY_BUILD_BATCH_SIZE:STRING'] = os.environ.get('MRPT_UNITY_BUILD_BATCH_SIZE', '8')
+        cmake.definitions['MRPT_ENABLE_PRECOMPILED_HDRS:BOOL']   = 'ON' if 'mrpt'  == modes['precompiled_headers'] else 'OFF'
+        cmake.definitions['CONAN_MRPT_PRECOMPILED_HEADERS:BOOL'] = 'ON' if 'cmake' == modes['precompiled_headers'] else 'OFF'
+
+        # Only build the requested MRPT libraries (and what they depend on)
+        modules = self._mrpt_modules
+        if modules is not None:
+            for m in self._mrpt_module_deps:
+                cmake.definitions[f'BUILD_mrpt-{m}:BOOL'] = 'ON' if m in modules else 'OFF'
+
         # Skipping xSens (3rd and 4th gen libs for xSens MT* devices)
         cmake.definitions['BUILD_XSENS_MT3:BOOL'] = 'FALSE'
         cmake.definitions['BUILD_XSENS_MT4:BOOL'] = 'FALSE'
@@ -262,16 +1062,62 @@ class MrptConan(ConanFile):
             'OpenCV_ROOT_DIR': self.deps_cpp_info['opencv'].rootpath,
         }
 
-        # Include our own libjpeg so that the linking across different systems
-        # isn't an issue.
-        # TODO I think this causes more problems then it solves
-        cmake.definitions['JPEG_INCLUDE_DIR:PATH'] = os.path.join(self.deps_cpp_info['libjpeg'].rootpath, 'include')
-        cmake.definitions['JPEG_LIBRARY:FILEPATH'] = os.path.join(self.deps_cpp_info['libjpeg'].rootpath, 'lib', 'libjpeg.so' if self.options['libjpeg'].shared else 'libjpeg.a')
+        # Parallelism.  Left alone, MRPT uses OpenMP if CMake finds it, and
+        # TBB if it happens to be installed on the builder
+        backend = self.options.parallel_backend
+        cmake.definitions['DISABLE_OPENMP:BOOL'] = 'OFF' if 'openmp' == backend else 'ON'
+        cmake.definitions['DISABLE_TBB:BOOL']    = 'OFF' if 'tbb'    == backend else 'ON'
+        if 'tbb' == backend:
+            # MRPT looks for TBB with pkg-config, other than on Windows where
+            # it takes the paths
+            tbb = self.deps_cpp_info['tbb']
+            cmake.definitions['TBB_INCLUDE_DIR:PATH'] = tbb.include_paths[0]
+            cmake.definitions['TBB_LIB_DIR:PATH']     = tbb.lib_paths[0]
+            env_vars['PKG_CONFIG_PATH'] = [os.path.join(p, 'pkgconfig') for p in tbb.lib_paths]
+
+        # libjpeg for CImage's JPEG (de)compression and rawlog images.  When
+        # MRPT doesn't find one it silently falls back to its embedded copy,
+        # see _check_jpeg_linkage
+        jpeg_library = self._jpeg_library
+        if jpeg_library is not None:
+            cmake.definitions['JPEG_INCLUDE_DIR:PATH'] = self.deps_cpp_info[str(self.options.jpeg_backend)].include_paths[0]
+            cmake.definitions['JPEG_LIBRARY:FILEPATH'] = jpeg_library
+
+        # Job pools only exist for Ninja.  Keep the translation units of the
+        # heavy libraries (the ones that made us drop /Zm1000) at a lower
+        # concurrency, while the rest of the build runs at full width.
+        if 'Ninja' == cmake.generator:
+            _, heavy_jobs = self._job_counts(cmake.generator)
+            cmake.definitions['CMAKE_JOB_POOLS:STRING']           = f'heavy_compile={heavy_jobs}'
+            cmake.definitions['CONAN_MRPT_HEAVY_JOB_POOL:STRING'] = 'heavy_compile'
+            cmake.definitions['CONAN_MRPT_HEAVY_TARGETS:STRING']  = os.environ.get(
+                'MRPT_HEAVY_TARGETS', 'mrpt-slam;mrpt-maps;mrpt-vision;mrpt-hwdrivers;mrpt-graphslam'
+            )
+
+        # Compiler cache.  Set as the launcher so that every compile line goes
+        # through it, and point it to a directory shared by every package ID
+        cache_tool = self._compiler_cache_tool
+        if cache_tool is not None:
+            cmake.definitions['CMAKE_C_COMPILER_LAUNCHER:FILEPATH']   = cache_tool
+            cmake.definitions['CMAKE_CXX_COMPILER_LAUNCHER:FILEPATH'] = cache_tool
+            env_vars.update(self._compiler_cache_env)
 
         return cmake, env_vars
 
+    @profiled
     def build(self):
 
+        self._check_source_patches()
+
+        # Profile guided optimization, the training run only happens if we
+        # don't already have a profile for this configuration
+        if self._pgo_enabled:
+            if os.path.isdir(self._pgo_profile_dir):
+                self.output.info(f'Using cached PGO profile {self._pgo_profile_dir}')
+            else:
+                with self._profile_phase('pgo_training'):
+                    self._pgo_train()
+
         cmake, env_vars = self._set_up_cmake()
 
         # Debug
@@ -291,45 +1137,1175 @@ class MrptConan(ConanFile):
             s += ' - %s=%s\n'%(k, v)
         self.output.info(s)
 
+        # CMake's build helper takes its job count from CONAN_CPU_COUNT
+        jobs, _ = self._job_counts(cmake.generator)
+        self.output.info(f'Building with generator {cmake.generator} and {jobs} parallel jobs')
+
+        self._profile.update({
+            'jobs':              jobs,
+            'generator':         cmake.generator,
+            'cmake_definitions': {k: str(v) for k,v in cmake.definitions.items()},
+        })
+
         with tools.environment_append(env_vars):
-            cmake.configure(source_folder=self.name)
-            cmake.build()
+            self._compiler_cache_stats(zero=True)
+            with self._profile_phase('configure'):
+                cmake.configure(source_folder=self._cmake_source_dir())
+            self._save_configure_state(cmake, env_vars)
+            with tools.environment_append({'CONAN_CPU_COUNT': str(jobs)}):
+                start = time.time()
+                with self._profile_phase('compile'):
+                    cmake.build()
+                self._record_build_time(time.time() - start, cmake.generator, jobs)
+            self._compiler_cache_stats()
+
+            if self.options.build_tests and not tools.cross_building(self.settings):
+                with self._profile_phase('test'):
+                    self._run_tests()
+
+    def _run_tests(self):
+        """
+        Run MRPT's test suite with ctest, on every core and with a timeout
+        per test (MRPT_TEST_TIMEOUT seconds, default 600.)  MRPT_TEST_SHARD=i/n
+        runs only the i-th (from 1) of n shards, i.e. every n-th test, so the
+        suite can be split across machines.
+
+        Each test's duration and result are written to
+        test_reports/ctest[-shard<i>of<n>].{xml,json} in the build folder, as
+        JUnit and JSON.  A failing test fails the build, after the reports
+        are written.
+        """
+
+        timeout = int(os.environ.get('MRPT_TEST_TIMEOUT', '600'))
+        # Multi-config generators (e.g. Visual Studio) have no tests without
+        # a configuration
+        cmd = ['ctest', f'-C {self.settings.build_type}', '--output-on-failure', f'-j{tools.cpu_count()}', f'--timeout {timeout}']
+
+        shard = os.environ.get('MRPT_TEST_SHARD')
+        suffix = ''
+        if shard:
+            m = re.match(r'^(?P<index>\d+)/(?P<count>\d+)$', shard)
+            if not m or not 1 <= int(m.group('index')) <= int(m.group('count')):
+                raise ConanException(f'MRPT_TEST_SHARD should be <index>/<count>, with index from 1 to count, not {shard}')
+            index, count = int(m.group('index')), int(m.group('count'))
+            # ctest numbers the tests from 1, start,end,stride
+            cmd += [f'-I {index},,{count}']
+            suffix = f'-shard{index}of{count}'
+
+        reports_dir = os.path.join(self.build_folder, 'test_reports')
+        if not os.path.isdir(reports_dir):
+            os.makedirs(reports_dir)
+        log = os.path.join(reports_dir, f'ctest{suffix}.log')
+        cmd += [f'--output-log "{log}"']
+
+        self.output.info('Running the MRPT tests%s'%(f' (shard {shard})' if shard else ''))
+        start = time.time()
+        failure = None
+        try:
+            self.run(' '.join(cmd), run_environment=True)
+        except ConanException as e:
+            failure = e
+        seconds = time.time() - start
+
+        tests = []
+        if os.path.exists(log):
+            with open(log) as f: tests = self._parse_ctest_log(f.read())
+        report = {
+            'version': self.version,
+            'shard':   shard,
+            'seconds': seconds,
+            'tests':   tests,
+        }
+        with open(os.path.join(reports_dir, f'ctest{suffix}.json'), 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        self._write_junit(os.path.join(reports_dir, f'ctest{suffix}.xml'), tests, seconds)
+
+        s = '\nSlowest MRPT tests:\n'
+        for t in sorted(tests, key=lambda t: -t['seconds'])[:10]:
+            s += ' %-40s %-10s %8.2f s\n'%(t['name'], t['status'], t['seconds'])
+        self.output.info(s)
+
+        if failure is not None:
+            failed = [t['name'] for t in tests if 'Passed' != t['status']]
+            raise ConanException('MRPT tests failed: %s (reports in %s)'%(', '.join(failed) or failure, reports_dir))
+
+    @staticmethod
+    def _parse_ctest_log(log):
+        """
+        Results from ctest's status lines, e.g.
+            "  3/12 Test  #7: test_mrpt_maps ...........   Passed    4.12 sec"
+            "  4/12 Test  #2: test_mrpt_base ...........***Timeout 600.01 sec"
+
+        @return List of {'number', 'name', 'status', 'seconds'}, in ctest's order
+        """
 
+        tests = []
+        for m in re.finditer(r'^\s*\d+/\d+ Test\s+#(?P<number>\d+): (?P<name>\S+) \.*\s*(?P<status>[^\n]*?)\s+(?P<seconds>[\d.]+) sec', log, re.MULTILINE):
+            tests.append({
+                'number':  int(m.group('number')),
+                'name':    m.group('name'),
+                'status':  m.group('status').strip('* '),
+                'seconds': float(m.group('seconds')),
+            })
+        return tests
+
+    @staticmethod
+    def _write_junit(path, tests, seconds):
+        """ Write the test results as a JUnit XML report """
+
+        failures = [t for t in tests if t['status'] not in ['Passed', 'Not Run']]
+        suite = ET.Element('testsuite', name='mrpt', tests=str(len(tests)), failures=str(len(failures)), time='%.3f'%seconds)
+        for t in tests:
+            case = ET.SubElement(suite, 'testcase', classname='mrpt', name=t['name'], time='%.3f'%t['seconds'])
+            if 'Not Run' == t['status']:
+                ET.SubElement(case, 'skipped')
+            elif 'Passed' != t['status']:
+                ET.SubElement(case, 'failure', message=t['status'])
+        ET.ElementTree(suite).write(path, encoding='utf-8', xml_declaration=True)
+
+    @profiled
     def package(self):
 
-        # Use cmake's install target
+        # Use cmake's install target.  Configuring MRPT is slow (all the
+        # OpenCV/PCL/VTK/Qt probing), so if build() already configured this
+        # build folder with the same definitions, go straight to install.
         cmake, env_vars = self._set_up_cmake()
-        with tools.environment_append(env_vars):
-            cmake.configure(source_folder=os.path.join(self.build_folder, self.name), build_folder=self.build_folder)
-        cmake.install()
+        if self.options.reuse_configure and self._configure_state_matches(cmake, env_vars):
+            # The install prefix in the cache is wherever build() thought the
+            # package would go (conan build/export-pkg use another folder), so
+            # run the install script with the right one
+            self.output.info('Reusing the CMake configuration from build()')
+            with self._profile_phase('install'):
+                self.run('cmake -DCMAKE_INSTALL_PREFIX="%s" -DCMAKE_INSTALL_CONFIG_NAME=%s -P cmake_install.cmake'%(
+                    self.package_folder, self.settings.build_type
+                ), cwd=self.build_folder)
+        else:
+            with tools.environment_append(env_vars), self._profile_phase('configure'):
+                cmake.configure(source_folder=self._cmake_source_dir(), build_folder=self.build_folder)
+            self._save_configure_state(cmake, env_vars)
+            with self._profile_phase('install'):
+                cmake.install()
+
+        if self._single_library:
+            # Everything in them is in libmrpt
+            for lib in glob.glob(os.path.join(self.package_folder, 'lib', 'libmrpt-*.a')):
+                os.remove(lib)
+
+        with self._profile_phase('jpeg_check'):
+            self._check_jpeg_linkage()
 
         # Fix up the CMake Find Script MRPT generated
-        if tools.os_info.i=s_windows:
+        if tools.os_info.is_windows:
             cmake_src_file = os.path.join(self.build_folder, 'MRPTConfig.cmake')
         else:
             cmake_src_file = os.path.join(self.build_folder, 'unix-install', 'MRPTConfig.cmake')
         cmake_dst_file = os.path.join(self.package_folder, self.mrpt_cmake_rel_dir, 'MRPTConfig.cmake')
         self.output.info('Inserting Conan variables in to the MRPT CMake Find script at found at %s and writting to %s'%(cmake_src_file, cmake_dst_file))
-        self._fixFindPackage(src=cmake_src_file, dst=cmake_dst_file)
+        with self._profile_phase('_fixFindPackage'):
+            self._fixFindPackage(src=cmake_src_file, dst=cmake_dst_file)
+
+        # Anything package_info needs to know about the build that can't be
+        # derived from the options on the consumer's machine
+        package_info = {
+            'eigen_max_align_bytes': self._eigen_align_bytes,
+        }
+        package_info.update(self._package_layout())
+        with open(os.path.join(self.package_folder, 'mrpt_package_info.json'), 'w') as f:
+            json.dump(package_info, f, indent=2, sort_keys=True)
+
+        if 'debug_info' in self.options and 'embedded' != self.options.debug_info:
+            with self._profile_phase('debug_info'):
+                self._strip_debug_info(split=('split' == self.options.debug_info))
 
     def package_info(self):
+        package_info = {}
+        package_info_file = os.path.join(self.package_folder, 'mrpt_package_info.json')
+        if os.path.exists(package_info_file):
+            with open(package_info_file) as f: package_info = json.load(f)
+
+        # Generators name the targets MRPT::<library>
+        self.cpp_info.names['cmake_find_package']       = 'MRPT'
+        self.cpp_info.names['cmake_find_package_multi'] = 'MRPT'
+
+        # Publish the libraries that were built, in link order.  Packages
+        # from before package() recorded them are still globbed here
+        libs = package_info.get('libs')
+        if libs is None:
+            libs = self._built_libs(tools.collect_libs(self))
+
+        if self._single_library or not hasattr(self.cpp_info, 'components'):
+            # One library, or a conan without components
+            cpp_info = self.cpp_info
+            cpp_info.libs = ['mrpt'] if self._single_library else libs
+        else:
+            self._set_components(libs, package_info.get('include_dirs', {}))
+            cpp_info = self.cpp_info.components['base']
+
         # Add the directory with CMake.. Not sure if this is a good use of resdirs
-        self.cpp_info.resdirs = [os.path.join(self.package_folder, self.mrpt_cmake_rel_dir)]
+        cpp_info.resdirs = [os.path.join(self.package_folder, self.mrpt_cmake_rel_dir)]
+
+        # The conan libjpegs come through the requirement, the system one
+        # has to be linked by the consumer of the static libraries
+        if 'system' == self.options.jpeg_backend and not self.options.shared:
+            cpp_info.libs += ['jpeg']
+
+        # Static libraries leave linking the OpenMP runtime to the consumer.
+        # TBB comes through the tbb requirement
+        if 'openmp' == self.options.parallel_backend and self.settings.compiler in ['gcc', 'clang'] and not self.options.shared:
+            cpp_info.sharedlinkflags += ['-fopenmp']
+            cpp_info.exelinkflags    += ['-fopenmp']
+
+        # Consumers must use the same Eigen alignment as MRPT was built with
+        align = package_info.get('eigen_max_align_bytes')
+        if align is not None:
+            cpp_info.defines += [f'EIGEN_MAX_ALIGN_BYTES={align}', f'EIGEN_MAX_STATIC_ALIGN_BYTES={align}']
+
+        # Let test_package report the build time comparison, and know which
+        # libraries it can benchmark
+        self.user_info.build_times_file = self.build_times_file
+        self.user_info.modules = ','.join(self._mrpt_modules or self._mrpt_module_deps)
+        self.user_info.jpeg_backend = str(self.options.jpeg_backend)
+
+        # Options the benchmark results depend on, test_package keeps a
+        # baseline for each combination
+        self.user_info.benchmark_options = ','.join(
+            f'{o}={self.options.get_safe(o)}' for o in [
+                'shared', 'simd', 'lto', 'pgo', 'parallel_backend', 'jpeg_backend',
+                'symbol_visibility', 'fast_linking', 'single_library',
+            ] if o in self.options
+        )
 
-        # Populate the pkg-config environment variables
+        # Populate the pkg-config environment variables, for the .pc files
+        # package() found
         with tools.pythonpath(self):
             from platform_helpers import appendPkgConfigPath
 
             pkg_config_path = os.path.join(self.package_folder, 'lib', 'pkgconfig')
-            appendPkgConfigPath(cf.adjust_path(pkg_config_path), self.env_info)
+            appendPkgConfigPath(self._adjust_path(pkg_config_path), self.env_info)
 
-            pc_files = glob.glob(cf.adjust_path(os.path.join(pkg_config_path, '*.pc')))
-            for f in pc_files:
-                p_name = re.sub(r'\.pc$', '', os.path.basename(f))
+            pc_names = package_info.get('pkg_config')
+            if pc_names is None:
+                pc_names = [re.sub(r'\.pc$', '', os.path.basename(f)) for f in glob.glob(self._adjust_path(os.path.join(pkg_config_path, '*.pc')))]
+            for p_name in pc_names:
                 p_name = re.sub(r'\W', '_', p_name.upper())
-                setattr(self.env_info, f'PKG_CONFIG_{p_name}_PREFIX', cf.adjust_path(self.package_folder))
+                setattr(self.env_info, f'PKG_CONFIG_{p_name}_PREFIX', self._adjust_path(self.package_folder))
+
+    def _package_layout(self):
+        """
+        Find the libraries, include directories and pkg-config files in the
+        package, once at package time rather than in every package_info
+        """
+
+        libs = self._built_libs(tools.collect_libs(self))
+
+        # MRPT 1.x installs each library's headers in their own directory
+        include_dirs = {}
+        config_dirs = [d for d in [os.path.join('include', 'mrpt', 'mrpt-config')] if os.path.isdir(os.path.join(self.package_folder, d))]
+        for lib in libs:
+            module = self._lib_module(lib)
+            module_dir = os.path.join('include', 'mrpt', module, 'include')
+            include_dirs[module] = ['include'] + config_dirs
+            if os.path.isdir(os.path.join(self.package_folder, module_dir)):
+                include_dirs[module].append(module_dir)
+
+        pkg_config = glob.glob(os.path.join(self.package_folder, 'lib', 'pkgconfig', '*.pc'))
+
+        return {
+            'libs':         libs,
+            'include_dirs': include_dirs,
+            'pkg_config':   sorted(re.sub(r'\.pc$', '', os.path.basename(f)) for f in pkg_config),
+        }
+
+    def _set_components(self, libs, include_dirs):
+        """
+        Publish each MRPT library as a component (target MRPT::<library>
+        with the cmake_find_package generators), requiring the MRPT libraries
+        it depends on and the requirements it uses (MRPT_MODULE_REQUIREMENTS)
+
+        @param libs The libraries in the package, see _package_layout
+        @param include_dirs Include directories of each library
+        """
+
+        deps = self._mrpt_module_deps
+        modules = {self._lib_module(l): l for l in libs}
+        if 'base' not in modules:
+            raise ConanException('mrpt-base is missing from the package (found: %s)'%', '.join(libs))
+
+        # Every requirement has to be used by some component
+        owners = {}
+        for m, reqs in MRPT_MODULE_REQUIREMENTS.items():
+            for r in reqs:
+                owners[r] = m
+        requirements = {}
+        for r in self.requires:
+            m = owners.get(r, 'base')
+            requirements.setdefault(m if m in modules else 'base', []).append(f'{r}::{r}')
+
+        for m, lib in modules.items():
+            component = self.cpp_info.components[m]
+            component.names['cmake_find_package']       = m
+            component.names['cmake_find_package_multi'] = m
+            component.libs        = [lib]
+            component.includedirs = include_dirs.get(m, ['include'])
+            component.requires    = [d for d in deps.get(m, []) if d in modules] + requirements.get(m, [])
+
+    @property
+    def _profile(self):
+        """
+        Resource usage of the recipe's phases, and the build parameters that
+        go with them.  Each method saves what it has so far into its folder,
+        and picks up what the previous method saved (see _profile_phase.)
+        """
+
+        if not hasattr(self, '_profile_data'):
+            self._profile_data = {'phases': []}
+        return self._profile_data
+
+    @staticmethod
+    def _resource_usage():
+        """ (CPU seconds, peak RSS in MB or None) of this process and its children so far """
+
+        t = os.times()
+        cpu = t.user + t.system + t.children_user + t.children_system
+        if resource is None:
+            return cpu, None
+
+        # Note, for the children this is the peak of the largest single
+        # child (e.g. one cc1plus), not of all of them combined
+        rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+        # ru_maxrss is in kB, except on macOS where it's in bytes
+        return cpu, rss / (1024.0 * 1024.0 if 'Darwin' == platform.system() else 1024.0)
+
+    @contextmanager
+    def _profile_phase(self, name):
+        """
+        Record the wall time, CPU time and peak RSS of a phase of the recipe.
+        Phases nest, the recipe methods themselves being the outermost ones
+        (see the profiled decorator.)  When a method ends, the profile is
+        written to its folder, and a summary is printed at the end of build()
+        and package().
+
+        @param name Name of the phase
+        """
+
+        # Carry on from what the previous method (maybe in another process) saved
+        folders = {
+            'build':   getattr(self, 'source_folder', None),
+            'package': getattr(self, 'build_folder', None),
+        }
+        if folders.get(name):
+            self._load_profile(folders[name])
+
+        depth = self._profile.setdefault('_depth', 0)
+        self._profile['_depth'] = depth + 1
+        record = {'phase': name, 'depth': depth}
+        self._profile['phases'].append(record)
+
+        wall = time.time()
+        cpu, _ = self._resource_usage()
+        try:
+            yield
+        finally:
+            end_cpu, rss = self._resource_usage()
+            record['wall_s'] = round(time.time() - wall, 3)
+            record['cpu_s'] = round(end_cpu - cpu, 3)
+            record['peak_rss_mb'] = round(rss, 1) if rss is not None else None
+            self._profile['_depth'] = depth
+
+            folder = {
+                'source':  getattr(self, 'source_folder', None),
+                'build':   getattr(self, 'build_folder', None),
+                'package': getattr(self, 'package_folder', None),
+            }.get(name) if 0 == depth else None
+            if folder:
+                self._save_profile(folder, final=('package' == name))
+                if name in ['build', 'package']:
+                    self._print_profile()
+
+    def _load_profile(self, folder):
+        """ Prepend the phases saved in folder to the ones recorded so far """
+
+        path = os.path.join(folder, 'conan_build_profile.json')
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path) as f: saved = json.load(f)
+        except ValueError:
+            self.output.warn(f'Could not read build profile {path}')
+            return
+
+        phases = [p for p in saved.pop('phases', []) if p not in self._profile['phases']]
+        saved.update(self._profile)
+        saved['phases'] = phases + self._profile['phases']
+        self._profile_data = saved
+
+    def _save_profile(self, folder, final=False):
+        """
+        Save the profile so far
+
+        @param folder Folder to save the profile in
+        @param final Whether this is the build_profile.json published in the package
+        """
+
+        data = {k: v for k,v in self._profile.items() if not k.startswith('_')}
+        if final:
+            data.update({
+                'version':  str(self.version),
+                'settings': {k: str(v) for k,v in self.settings.values_list},
+                'options':  {k: str(v) for k,v in self.options.values.as_list()},
+            })
+        path = os.path.join(folder, 'build_profile.json' if final else 'conan_build_profile.json')
+        with open(path, 'w') as f: json.dump(data, f, indent=2, sort_keys=True)
+
+    def _print_profile(self):
+        """ Print a summary table of the phases recorded so far """
+
+        s = '\nBuild profile'
+        if self._profile.get('jobs'):
+            s += ' (%s, %d jobs)'%(self._profile.get('generator') or 'default generator', self._profile['jobs'])
+        s += ':\n'
+        s += ' %-28s %10s %10s %12s\n'%('phase', 'wall (s)', 'cpu (s)', 'peak RSS MB')
+        for p in self._profile['phases']:
+            if 'wall_s' not in p:
+                # Still running (i.e. the method printing this)
+                continue
+            rss = '%.1f'%p['peak_rss_mb'] if p.get('peak_rss_mb') is not None else '-'
+            s += ' %-28s %10.1f %10.1f %12s\n'%('  ' * p['depth'] + p['phase'], p['wall_s'], p['cpu_s'], rss)
+        self.output.info(s)
+
+    @property
+    def compiler_cache_dir(self):
+        """
+        Directory used by the compiler cache.  It's deliberately outside of
+        the conan build folder so that it is shared by every package ID (i.e.
+        changing shared or a with_* option can still reuse objects.)  Can be
+        overridden with the MRPT_COMPILER_CACHE_DIR environment variable.
+        """
+
+        default = os.path.join(os.path.expanduser('~'), '.cache', 'conan-mrpt', str(self.options.compiler_cache))
+        return os.environ.get('MRPT_COMPILER_CACHE_DIR', default)
+
+    @property
+    def _compiler_cache_tool(self):
+        """ Path to the compiler cache executable, or None if not in use """
+
+        if 'none' == self.options.compiler_cache:
+            return None
+
+        exe = tools.which(str(self.options.compiler_cache))
+        if exe is None:
+            self.output.warn('Compiler cache %s was requested but could not be found, building without it'%self.options.compiler_cache)
+        return exe
+
+    @property
+    def _compiler_cache_env(self):
+        """ Environment the compiler cache needs to share objects across builds """
+
+        if 'ccache' == self.options.compiler_cache:
+            return {
+                'CCACHE_DIR':       self.compiler_cache_dir,
+                # Hash paths relative to the build folder, and ignore the
+                # working directory, otherwise every package ID (each in its
+                # own build folder) would have its own cache entries
+                'CCACHE_BASEDIR':   self.build_folder,
+                'CCACHE_NOHASHDIR': 'true',
+            }
+        else:
+            # Note, sccache has no equivalent to CCACHE_BASEDIR, so it only
+            # hits on identical absolute paths.
+            return {
+                'SCCACHE_DIR': self.compiler_cache_dir,
+            }
+
+    def _compiler_cache_stats(self, zero=False):
+        """
+        Print (or reset) the compiler cache hit/miss statistics.  The stats
+        are reset before the build so that what we print afterwards only
+        covers this build (modulo other builds sharing the cache at the same
+        time.)
+
+        @param zero Reset the statistics rather than print them
+        """
+
+        cache_tool = self._compiler_cache_tool
+        if cache_tool is None:
+            return
+
+        # Both ccache and sccache use the same flags
+        flag = '--zero-stats' if zero else '--show-stats'
+
+        if not zero:
+            self.output.info('Compiler cache (%s) statistics, cache dir: %s'%(self.options.compiler_cache, self.compiler_cache_dir))
+        try:
+            self.run(f'"{cache_tool}" {flag}')
+        except ConanException:
+            self.output.warn('Could not query the compiler cache statistics')
+
+    @property
+    def _cmake_generator(self):
+        """ CMake generator to use, None lets conan pick its default """
+
+        if 'Ninja' == self.options.generator:
+            return 'Ninja'
+        if 'auto' == self.options.generator and tools.which('ninja') is not None:
+            return 'Ninja'
+        return None
+
+    @property
+    def _mem_per_job_mb(self):
+        """ Memory budget (MB) of a regular compile job, set with MRPT_BUILD_MEM_PER_JOB_MB """
+        return int(os.environ.get('MRPT_BUILD_MEM_PER_JOB_MB', 1536))
+
+    @property
+    def _heavy_mem_per_job_mb(self):
+        """ Memory budget (MB) of a heavy compile job, set with MRPT_BUILD_HEAVY_MEM_PER_JOB_MB """
+        return int(os.environ.get('MRPT_BUILD_HEAVY_MEM_PER_JOB_MB', 4096))
+
+    @staticmethod
+    def _available_memory():
+        """ Available physical memory in bytes, or None if it can't be determined """
+
+        try:
+            with open('/proc/meminfo') as f:
+                m = re.search(r'^MemAvailable:\s+(\d+) kB', f.read(), re.MULTILINE)
+            if m:
+                return int(m.group(1)) * 1024
+        except IOError:
+            pass
+
+        try:
+            return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+        except (AttributeError, ValueError, OSError):
+            return None
+
+    def _parallel_jobs(self, mem_per_job_mb):
+        """
+        Number of parallel jobs that fit both the CPUs and the available memory
+
+        @param mem_per_job_mb Memory budget of a single job
+        """
+
+        cpus = tools.cpu_count()
+        mem = self._available_memory()
+        if mem is None:
+            return cpus
+        return max(1, min(cpus, mem // (mem_per_job_mb * 1024 * 1024)))
+
+    def _job_counts(self, generator):
+        """
+        Number of parallel jobs for the build, and for the heavy job pool
+        (Ninja only.)  The heavy jobs still count towards the total, so
+        their memory comes out of the budget before the regular jobs are
+        sized: the heavy pool gets at most half the available memory, the
+        regular jobs what's left, so that even with the pool full the build
+        fits in memory.  Without a pool nothing stops every job from being a
+        heavy one, so all of them get the heavy budget.
+
+        @return (jobs, heavy_jobs), heavy_jobs is None without a job pool
+        """
+
+        if 'Ninja' != generator:
+            return self._parallel_jobs(self._heavy_mem_per_job_mb), None
+
+        cpus = tools.cpu_count()
+        mem = self._available_memory()
+        if mem is None:
+            return cpus, cpus
+
+        mb = 1024 * 1024
+        heavy = max(1, min(cpus, (mem // 2) // (self._heavy_mem_per_job_mb * mb)))
+        regular = max(0, mem - heavy * self._heavy_mem_per_job_mb * mb) // (self._mem_per_job_mb * mb)
+        return max(1, min(cpus, heavy + regular)), heavy
+
+    @property
+    def _mrpt_module_deps(self):
+        """ MRPT_MODULE_DEPS, adjusted for this version """
+
+        deps = {k: list(v) for k,v in MRPT_MODULE_DEPS.items()}
+        mrpt_version = Version(str(self.version))
+        if mrpt_version < '1.3.0':
+            # mrpt-nav was still called mrpt-reactivenav
+            del deps['nav']
+        else:
+            del deps['reactivenav']
+        if mrpt_version < '1.5.0':
+            # ICP was still in mrpt-scanmatching
+            deps['slam'].append('scanmatching')
+        else:
+            # mrpt-scanmatching was merged into mrpt-tfest
+            del deps['scanmatching']
+        return deps
+
+    @property
+    def _mrpt_modules(self):
+        """
+        Closure of the MRPT libraries requested with the modules option, in
+        link order (dependents before their dependencies.)
+
+        @return List of module names (without the mrpt- prefix), or None to build everything
+        """
+
+        requested = [m for m in re.split(r'[,;\s]+', str(self.options.modules)) if m]
+        if not requested or requested == ['all']:
+            return None
+
+        deps = self._mrpt_module_deps
+        wanted = set()
+        for m in requested:
+            m = re.sub(r'^(lib)?mrpt-', '', m)
+            if 'poses' == m:
+                # Not a library of its own in MRPT 1.x
+                m = 'base'
+            if 'nav' == m and 'reactivenav' in deps:
+                m = 'reactivenav'
+            if m not in deps:
+                raise ConanException('Unknown MRPT module %s, MRPT %s has: %s'%(m, self.version, ', '.join(sorted(deps))))
+            wanted.add(m)
+
+        return self._mrpt_modules_order(deps, wanted)
+
+    def _built_libs(self, libs):
+        """
+        Filter and sort the MRPT libraries found in the package
+
+        @param libs Library names found in the package (e.g. mrpt-base, libmrpt-base155-dbg)
+        @return The libraries of the selected modules, in link order
+        """
+
+        module_of = self._lib_module
+
+        libs = [l for l in libs if module_of(l) is not None]
+
+        modules = self._mrpt_modules
+        if modules is not None:
+            libs = [l for l in libs if module_of(l) in modules]
+        else:
+            # Everything was built, order whatever we know about and leave
+            # anything else at the end
+            modules = self._mrpt_modules_order(self._mrpt_module_deps)
+
+        return sorted(libs, key=lambda l: modules.index(module_of(l)) if module_of(l) in modules else len(modules))
+
+    @staticmethod
+    def _lib_module(lib):
+        """ MRPT module of a library name (e.g. libmrpt-base155-dbg is base), None if it isn't one """
+
+        m = re.match(r'^(lib)?mrpt-(?P<module>[a-z_]+?)\d*(-dbg)?$', lib)
+        return m.group('module') if m else None
+
+    @staticmethod
+    def _mrpt_modules_order(deps, roots=None):
+        """
+        Closure of roots over deps, with dependents before their dependencies
+
+        @param deps Dictionary of the direct dependencies of each module
+        @param roots Modules to start from, defaults to all of them
+        """
 
-            appendPkgConfigPath(cf.adjust_path(pkg_config_path), self.env_info)
+        order = []
+        def visit(m):
+            if m in order:
+                return
+            for d in deps[m]:
+                visit(d)
+            order.append(m)
+        for m in sorted(roots if roots is not None else deps):
+            visit(m)
+        return list(reversed(order))
+
+    @property
+    def _simd_flags(self):
+        """ Compiler flags for the instruction set selected with the simd option """
+
+        if 'Visual Studio' == self.settings.compiler:
+            flags = {
+                # SSE2 is implied on x86_64
+                'sse2':   ['/arch:SSE2'] if 'x86' == self.settings.arch else [],
+                'sse4':   [],
+                'avx2':   ['/arch:AVX2'],
+                'avx512': ['/arch:AVX512'],
+                # MSVC has no equivalent to -march=native
+                'native': [],
+            }
+        else:
+            flags = {
+                'sse2':   ['-msse2'],
+                'sse4':   ['-msse4.2'],
+                'avx2':   ['-mavx2', '-mfma'],
+                'avx512': ['-mavx512f', '-mavx512cd', '-mavx512vl', '-mavx512bw', '-mavx512dq', '-mfma'],
+                'native': ['-march=native'],
+            }
+        return flags[str(self.options.simd)]
+
+    @property
+    def _eigen_align_bytes(self):
+        """
+        Eigen's maximum alignment for the selected instruction set, or None if
+        it should be left to Eigen (i.e. no simd option on this arch.)  For
+        'native' this is determined from the builder's CPU.
+        """
+
+        if 'simd' not in self.options:
+            return None
+
+        simd = str(self.options.simd)
+        if 'native' == simd:
+            simd = 'sse2'
+            try:
+                with open('/proc/cpuinfo') as f: cpu_flags = f.read()
+                if re.search(r'\bavx512f\b', cpu_flags):
+                    simd = 'avx512'
+                elif re.search(r'\bavx\b', cpu_flags):
+                    simd = 'avx2'
+            except IOError:
+                self.output.warn('Could not read the CPU flags, assuming 16 byte Eigen alignment for simd=native')
+
+        return {'sse2': 16, 'sse4': 16, 'avx2': 32, 'avx512': 64}[simd]
+
+    @property
+    def _single_library(self):
+        return 'single_library' in self.options and bool(self.options.single_library)
+
+    @property
+    def _pgo_enabled(self):
+        return 'pgo' in self.options and bool(self.options.pgo)
+
+    @property
+    def _pgo_profile_dir(self):
+        """
+        Cached profile for this version and package ID (MRPT_PGO_CACHE_DIR
+        overrides the cache location.)  The package ID covers the settings
+        and options, and as gcc names its profiles after the object files,
+        which live in the build folder named after the package ID, it's also
+        what makes a gcc profile reusable.
+        """
+
+        default = os.path.join(os.path.expanduser('~'), '.cache', 'conan-mrpt', 'pgo')
+        key = hashlib.sha1(f'{self.version}/{self.info.package_id()}'.encode('utf-8')).hexdigest()
+        return os.path.join(os.environ.get('MRPT_PGO_CACHE_DIR', default), key)
+
+    def _pgo_flags(self, phase):
+        """
+        Compiler (and linker) flags for a PGO phase
+
+        @param phase 'generate' for the instrumented build, 'use' for the optimized one
+        """
+
+        training_dir = self._pgo_profile_dir + '.training'
+        if 'clang' in str(self.settings.compiler):
+            if 'generate' == phase:
+                # Where the .profraw files go is set at runtime by LLVM_PROFILE_FILE
+                return ['-fprofile-instr-generate']
+            return [
+                '-fprofile-instr-use=%s'%os.path.join(self._pgo_profile_dir, 'mrpt.profdata'),
+                '-Wno-profile-instr-unprofiled',
+                '-Wno-profile-instr-out-of-date',
+            ]
+        else:
+            if 'generate' == phase:
+                return [f'-fprofile-generate={training_dir}']
+            return [
+                f'-fprofile-use={self._pgo_profile_dir}',
+                '-fprofile-correction',
+                '-Wno-missing-profile',
+            ]
+
+    def _pgo_train(self):
+        """
+        First PGO pass: build MRPT instrumented, then build and run the
+        workload in pgo/ against the build tree.  The resulting profile is
+        moved into the cache once complete.
+        """
+
+        training_dir = self._pgo_profile_dir + '.training'
+        if os.path.exists(training_dir):
+            shutil.rmtree(training_dir)
+        os.makedirs(training_dir)
+
+        self.output.info('PGO: building instrumented MRPT')
+        cmake, env_vars = self._set_up_cmake(pgo_phase='generate')
+        jobs, _ = self._job_counts(cmake.generator)
+        with tools.environment_append(env_vars):
+            cmake.configure(source_folder=self._cmake_source_dir())
+            with tools.environment_append({'CONAN_CPU_COUNT': str(jobs)}):
+                cmake.build()
+
+        # Only exercise the libraries we built
+        workload_modules = ['base', 'obs', 'maps', 'slam', 'vision']
+        if self._mrpt_modules is not None:
+            workload_modules = [m for m in workload_modules if m in self._mrpt_modules]
+
+        self.output.info('PGO: building the training workload (%s)'%', '.join(workload_modules))
+        pgo_flags = ' '.join(self._pgo_flags('generate'))
+        workload = CMake(self, generator=self._cmake_generator)
+        workload.definitions['MRPT_DIR:PATH']                  = self.build_folder
+        workload.definitions['MRPT_WORKLOAD_MODULES:STRING']   = ';'.join(workload_modules)
+        workload.definitions['CMAKE_CXX_FLAGS:STRING']         = pgo_flags
+        workload.definitions['CMAKE_EXE_LINKER_FLAGS:STRING']  = pgo_flags
+        workload_build_folder = os.path.join(self.build_folder, 'pgo-workload')
+        workload.configure(source_folder=os.path.join(self.source_folder, 'pgo'), build_folder=workload_build_folder)
+        workload.build()
+
+        self.output.info('PGO: running the training workload')
+        with tools.environment_append({
+            'LD_LIBRARY_PATH':   os.pathsep.join([os.path.join(self.build_folder, 'lib'), os.environ.get('LD_LIBRARY_PATH', '')]),
+            'LLVM_PROFILE_FILE': os.path.join(training_dir, 'mrpt-%p.profraw'),
+        }):
+            self.run(os.path.join(workload_build_folder, 'bin', 'mrpt-pgo-workload'))
+
+        if 'clang' in str(self.settings.compiler):
+            raw = ' '.join(glob.glob(os.path.join(training_dir, '*.profraw')))
+            self.run('llvm-profdata merge -output=%s %s'%(os.path.join(training_dir, 'mrpt.profdata'), raw))
+
+        os.rename(training_dir, self._pgo_profile_dir)
+        self.output.info(f'PGO: cached profile in {self._pgo_profile_dir}')
+
+    @property
+    def _jpeg_library(self):
+        """ Path of the library the jpeg_backend option selects, None for the system one """
+
+        backend = str(self.options.jpeg_backend)
+        if 'system' == backend:
+            return None
+
+        dep = self.deps_cpp_info[backend]
+        # libjpeg-turbo also packages its TurboJPEG API, which MRPT doesn't use
+        lib = next(l for l in dep.libs if 'turbojpeg' not in l)
+        shared = self.options[backend].shared
+        if 'Windows' == self.settings.os:
+            name = f'{lib}.lib'
+        else:
+            name = 'lib%s.%s'%(lib, ('dylib' if 'Macos' == self.settings.os else 'so') if shared else 'a')
+
+        for lib_path in dep.lib_paths:
+            path = os.path.join(lib_path, name)
+            if os.path.exists(path):
+                return path
+        raise ConanException('Could not find %s in the %s package (%s)'%(name, backend, ', '.join(dep.lib_paths)))
+
+    def _check_jpeg_linkage(self):
+        """
+        Check that MRPT's image code uses the libjpeg the jpeg_backend option
+        selects: that MRPT didn't fall back to its embedded copy
+        (MRPT_HAS_JPEG_SYSTEM in its config header, only a warning on Windows
+        where MRPT doesn't look for another one), and, for a shared libjpeg,
+        that the packaged mrpt-base (or single libmrpt) shared library links
+        to it.
+        """
+
+        backend = str(self.options.jpeg_backend)
+
+        config_headers = glob.glob(os.path.join(self.package_folder, 'include', '**', '*config*.h'), recursive=True)
+        for header in config_headers:
+            with open(header) as f:
+                m = re.search(r'#define\s+MRPT_HAS_JPEG_SYSTEM\s+(\d)', f.read())
+            if m:
+                if '1' != m.group(1):
+                    msg = f'MRPT was built with its embedded libjpeg rather than {backend}, see {header}'
+                    # MRPT 1.x's script_jpeg.cmake only looks for an external
+                    # libjpeg on UNIX, Windows builds always use the embedded one
+                    if self.settings.os == 'Windows':
+                        self.output.warn(msg)
+                    else:
+                        raise ConanException(msg)
+                break
+        else:
+            self.output.warn('Could not find MRPT_HAS_JPEG_SYSTEM in the MRPT headers')
+
+        if self.settings.os != 'Linux' or not self.options.shared:
+            return
+        if backend != 'system' and not self.options[backend].shared:
+            # Nothing to see in the dynamic section, it's linked in
+            self.output.info(f'MRPT is linked to the static {backend}')
+            return
+
+        pattern = 'libmrpt.so*' if self._single_library else 'libmrpt-base*.so*'
+        libs = [l for l in glob.glob(os.path.join(self.package_folder, 'lib', pattern)) if not os.path.islink(l)]
+        if not libs:
+            self.output.warn(f'Could not find {pattern} to check which libjpeg it links to')
+            return
+
+        needed = self._elf_dynamic(libs[0]).get('NEEDED', [])
+        if 'system' == backend:
+            expected = [n for n in needed if re.match(r'libjpeg\.so', n)]
+        else:
+            expected = [n for n in self._elf_dynamic(self._jpeg_library).get('SONAME', []) if n in needed]
+        if not expected:
+            raise ConanException('%s does not link to %s (NEEDED: %s)'%(os.path.basename(libs[0]), backend, ', '.join(needed)))
+        self.output.info('%s links to %s (%s)'%(os.path.basename(libs[0]), backend, expected[0]))
+
+    @staticmethod
+    def _elf_dynamic(path):
+        """ Dynamic section of the ELF file at path, e.g. {'NEEDED': [...], 'SONAME': [...]} """
+
+        try:
+            out = subprocess.check_output(['readelf', '-d', '--wide', path], stderr=subprocess.STDOUT).decode('utf-8', 'replace')
+        except (OSError, subprocess.CalledProcessError):
+            return {}
+
+        entries = {}
+        for m in re.finditer(r'\((?P<tag>\w+)\)\s+[^\[\n]*\[(?P<value>[^\]]+)\]', out):
+            entries.setdefault(m.group('tag'), []).append(m.group('value'))
+        return entries
+
+    @property
+    def _debug_compression(self):
+        """
+        Compression for the split debug sections: MRPT_DEBUG_COMPRESSION
+        (zstd, zlib or none), by default zstd if objcopy supports it
+        """
+
+        compression = os.environ.get('MRPT_DEBUG_COMPRESSION')
+        if compression is None:
+            try:
+                usage = subprocess.check_output(['objcopy', '--help'], stderr=subprocess.STDOUT).decode('utf-8', 'replace')
+            except (OSError, subprocess.CalledProcessError):
+                usage = ''
+            compression = 'zstd' if 'zstd' in usage else 'zlib'
+        return compression
+
+    @staticmethod
+    def _has_debug_info(path):
+        """ Whether the ELF file at path has DWARF sections """
+
+        try:
+            sections = subprocess.check_output(['readelf', '-S', '--wide', path], stderr=subprocess.STDOUT)
+        except (OSError, subprocess.CalledProcessError):
+            return False
+        return b'.debug_info' in sections
+
+    @staticmethod
+    def _build_id(path):
+        """ GNU build ID (hex) of the ELF file at path, None if it has none """
+
+        try:
+            notes = subprocess.check_output(['readelf', '-n', '--wide', path], stderr=subprocess.STDOUT).decode('utf-8', 'replace')
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        m = re.search(r'Build ID: ([0-9a-f]+)', notes)
+        return m.group(1) if m else None
+
+    @property
+    def _debug_symbols_folder(self):
+        """ Where debug_info=split puts the debug info, for mrpt-debug to package """
+        return os.path.join(self.build_folder, 'debug_symbols')
+
+    def _strip_debug_info(self, split):
+        """
+        Strip the debug info out of the packaged shared libraries and
+        executables.  When splitting, the (compressed) debug info is first
+        moved out of the package, to lib/debug/.build-id/<xx>/<rest>.debug
+        in _debug_symbols_folder, where the mrpt-debug companion package
+        (mrpt-debug/conanfile.py) packages it from.  So the package, and
+        every download of it, doesn't carry the debug info, while gdb still
+        finds it through the build ID with the debug-file-directory mrpt-debug
+        publishes.
+
+        Static libraries are only stripped of their debug info (with
+        debug_info=none), as their debug info ends up in whatever links them.
+
+        @param split Whether to keep the debug info in separate files, rather
+               than dropping it
+        """
+
+        binaries = []
+        for folder in ['lib', 'bin']:
+            for path in glob.glob(os.path.join(self.package_folder, folder, '*')):
+                if os.path.islink(path) or not os.path.isfile(path):
+                    continue
+                if re.search(r'\.so(\.\d+)*$', path) or (folder == 'bin' and os.access(path, os.X_OK)):
+                    binaries.append(path)
+                elif path.endswith('.a') and not split:
+                    self.run(f'strip --strip-debug "{path}"')
+
+        compression = self._debug_compression
+        debug_root = os.path.join(self._debug_symbols_folder, 'lib', 'debug')
+        if split and os.path.exists(self._debug_symbols_folder):
+            # From an earlier package() of this build folder
+            shutil.rmtree(self._debug_symbols_folder)
+
+        for path in binaries:
+            if not self._has_debug_info(path):
+                if not split:
+                    self.run(f'strip --strip-unneeded "{path}"')
+                continue
+
+            if split:
+                # gdb looks up <debug-file-directory>/.build-id/xx/rest.debug
+                # wherever the binary is.  Without a build ID (it's linked
+                # with --build-id, so only if the toolchain ignored it), only
+                # the .gnu_debuglink name is left to find it by, the file has
+                # to be copied next to the binary
+                build_id = self._build_id(path)
+                if build_id:
+                    debug_file = os.path.join(debug_root, '.build-id', build_id[:2], build_id[2:] + '.debug')
+                else:
+                    self.output.warn(f'{os.path.basename(path)} has no build ID')
+                    debug_file = os.path.join(debug_root, os.path.basename(path) + '.debug')
+                if not os.path.isdir(os.path.dirname(debug_file)):
+                    os.makedirs(os.path.dirname(debug_file))
+
+                compress = f'--compress-debug-sections={compression}' if 'none' != compression else ''
+                self.run(f'objcopy --only-keep-debug {compress} "{path}" "{debug_file}"')
+                self.run(f'objcopy --strip-debug --strip-unneeded --add-gnu-debuglink="{debug_file}" "{path}"')
+            else:
+                self.run(f'strip --strip-unneeded "{path}"')
+
+        self.output.info('%s the debug info of %d binaries'%('Split' if split else 'Stripped', len(binaries)))
+        if split:
+            self.output.info(
+                f'The debug info is in {self._debug_symbols_folder}, package it with:\n'
+                f'    conan export-pkg mrpt-debug mrpt-debug/{self.version}@<user>/<channel> '
+                f'--build-folder="{self.build_folder}" <the settings and options of this build>'
+            )
+
+    def _compile_modes(self):
+        """
+        Work out which unity build and precompiled header modes can actually
+        be used for this version and compiler.  Rather than failing, modes
+        that can't be used fall back to a regular build.
+
+        @return ({'unity_build': bool, 'precompiled_headers': 'none'|'mrpt'|'cmake'}, [fallback notes])
+        """
+
+        notes = []
+        unity = bool(self.options.unity_build)
+        if unity and Version(str(self.version)) < '1.5.0':
+            # Several MRPT <1.5 libraries have file-static helpers with the
+            # same names in different sources, which collide once the sources
+            # are concatenated
+            notes.append(f'MRPT {self.version} does not build as a unity build, falling back to a regular build')
+            unity = False
+
+        pch = 'none'
+        if self.options.precompiled_headers:
+            if 'Visual Studio' == self.settings.compiler:
+                if unity:
+                    # MRPT's /Yc /Yu setup doesn't survive its sources being
+                    # merged, and the unity build already saves most of the
+                    # header parsing
+                    notes.append('Precompiled headers are not used with MSVC unity builds')
+                else:
+                    pch = 'mrpt'
+            else:
+                # MRPT (all of 1.2.2 - 1.5.x) only sets up precompiled
+                # headers for MSVC, so use CMake's instead (our hook in
+                # CMakeLists.txt, which is a no-op before CMake 3.16)
+                pch = 'cmake'
+
+        return {'unity_build': unity, 'precompiled_headers': pch}, notes
+
+    @property
+    def build_times_file(self):
+        """
+        History of build times, used to compare the unity build and
+        precompiled header modes (see test_package).  Can be overridden with
+        the MRPT_BUILD_TIMES_FILE environment variable.
+        """
+
+        default = os.path.join(os.path.expanduser('~'), '.cache', 'conan-mrpt', 'build_times.json')
+        return os.environ.get('MRPT_BUILD_TIMES_FILE', default)
+
+    def _record_build_time(self, seconds, generator, jobs):
+        """ Append the duration of the compile step to the build time history """
+
+        modes, _ = self._compile_modes()
+        entry = {
+            'version':             str(self.version),
+            'os':                  str(self.settings.os),
+            'arch':                str(self.settings.arch),
+            'compiler':            f'{self.settings.compiler} {self.settings.compiler.version}',
+            'build_type':          str(self.settings.build_type),
+            'shared':              bool(self.options.shared),
+            'unity_build':         modes['unity_build'],
+            'precompiled_headers': modes['precompiled_headers'],
+            'generator':           generator or 'default',
+            'jobs':                jobs,
+            'compiler_cache':      str(self.options.compiler_cache),
+            'seconds':             round(seconds, 1),
+            'date':                time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        self.output.info('Compiled MRPT in %.1fs'%seconds)
+
+        history = []
+        if os.path.exists(self.build_times_file):
+            try:
+                with open(self.build_times_file) as f: history = json.load(f)
+            except ValueError:
+                self.output.warn('Could not read build time history %s, starting a new one'%self.build_times_file)
+        elif not os.path.isdir(os.path.dirname(self.build_times_file)):
+            os.makedirs(os.path.dirname(self.build_times_file))
+
+        history = (history + [entry])[-200:]
+        with open(self.build_times_file, 'w') as f: json.dump(history, f, indent=2)
+
+    @property
+    def _configure_state_file(self):
+        """ File in which we record what the build folder was configured with """
+        return os.path.join(self.build_folder, 'conan_configure_state.json')
+
+    @staticmethod
+    def _configure_state(cmake, env_vars):
+        """ Serializable state (definitions and environment) of a CMake configuration """
+
+        # The job pool size depends on the memory free at the time, and has
+        # no effect on install, so it shouldn't force a re-configure.  Neither
+        # should the install prefix, package() passes that to the install
+        # script itself
+        volatile = ['CMAKE_JOB_POOLS:STRING', 'CMAKE_INSTALL_PREFIX']
+
+        state = {
+            'definitions': {k: str(v) for k,v in cmake.definitions.items() if k not in volatile},
+            'env':         {k: str(v) for k,v in env_vars.items()},
+        }
+        state['hash'] = hashlib.sha1(json.dumps(state, sort_keys=True).encode('utf-8')).hexdigest()
+        return state
+
+    def _save_configure_state(self, cmake, env_vars):
+        """ Record the configuration so package() can tell if it has to re-configure """
+
+        with open(self._configure_state_file, 'w') as f:
+            json.dump(self._configure_state(cmake, env_vars), f, indent=2, sort_keys=True)
+
+    def _configure_state_matches(self, cmake, env_vars):
+        """
+        Check whether the build folder was already configured with exactly
+        these definitions and environment
+
+        @return True if the existing configuration can be reused
+        """
+
+        if not os.path.exists(os.path.join(self.build_folder, 'CMakeCache.txt')):
+            return False
+        if not os.path.exists(self._configure_state_file):
+            self.output.info('No recorded CMake configuration, re-configuring')
+            return False
+
+        try:
+            with open(self._configure_state_file) as f: saved = json.load(f)
+        except ValueError:
+            self.output.warn('Could not read %s, re-configuring'%self._configure_state_file)
+            return False
+
+        state = self._configure_state(cmake, env_vars)
+        if saved.get('hash') == state['hash']:
+            return True
+
+        s = '\nCMake definitions changed since build(), re-configuring:\n'
+        old_defs = saved.get('definitions', {})
+        for k in sorted(set(old_defs) | set(state['definitions'])):
+            if old_defs.get(k) != state['definitions'].get(k):
+                s += ' - %s: %s -> %s\n'%(k, old_defs.get(k), state['definitions'].get(k))
+        self.output.info(s)
+        return False
+
+    def _adjust_path(self, path):
+        """ cf.adjust_path, which also wants the settings in newer conans """
+
+        try:
+            return cf.adjust_path(path)
+        except TypeError:
+            return cf.adjust_path(path, self.settings)
 
     @property
     def mrpt_cmake_rel_dir(self):
@@ -344,10 +2320,12 @@ class MrptConan(ConanFile):
     def _fixFindPackage(self, src, dst):
         """
         Insert some variables into the MRPT find script generated in the
-        build so that we can use it in our CMake scripts
+        build so that we can use it in our CMake scripts.  The rewriting
+        itself is done by FIND_PACKAGE_RULES, see _apply_find_package_rules
 
         @param src Source path of the find script
         @param dst Destination (file we write to) of the find script
+        @return Report of the rules applied, see _apply_find_package_rules
         """
 
         if not os.path.exists(src):
@@ -360,17 +2338,21 @@ class MrptConan(ConanFile):
             self.output.info('MRPTConfig.cmake file already patched with Conan variables')
             return
 
-        m = re.search(r'get_filename_component.THIS_MRPT_CONFIG_PATH "..CMAKE_CURRENT_LIST_FILE." PATH.', data)
-        if m:
-            data = data.replace(m.group(0), 'set(THIS_MRPT_CONFIG_PATH ${CONAN_MRPT_ROOT})')
-        else:
-            m = re.search(r'SET.MRPT_DIR "(?P<base>.*?)(?P<type>(build|package))(?P<rest>.*?(?="))', data)
+        rules = [r for r in FIND_PACKAGE_RULES if r.applies_to(self.version)]
+
+        report = {}
+        if not FIND_PACKAGE_CONFIG_PATH.search(data):
+            # Older scripts hardcode the build/package path instead.  Those
+            # are replaced in a pass of their own, before the rules that would
+            # otherwise grab the SET(...) lines containing them
+            m = FIND_PACKAGE_MRPT_DIR_FALLBACK.search(data)
             if not m:
                 self.output.warn('Could not find MRPT source directory in CMake file: %s'%src)
                 return
-            for t in ['build', 'package']:
-                data = data.replace(m.group('base') + t + m.group('rest'), '${CONAN_MRPT_ROOT}')
-
+            data, report = self._apply_find_package_rules(data, [
+                FindPackageRule(f'mrpt_dir_{t}', re.escape(m.group('base') + t + m.group('rest')), '${CONAN_MRPT_ROOT}')
+                for t in ['build', 'package']
+            ])
 
         mrpt_version = Version(str(self.version))
         if mrpt_version <= '2':
@@ -384,118 +2366,22 @@ class MrptConan(ConanFile):
 
 ''' + data
 
+            # Now, replace any free floating conan path, just in case some were missed here
+            rules += [
+                FindPackageRule('package_folder', re.escape(self.package_folder), '${CONAN_MRPT_ROOT}'),
+                FindPackageRule('package_folder_adjusted', re.escape(self._adjust_path(self.package_folder)), '${CONAN_MRPT_ROOT}'),
+            ]
 
-            m = re.search(r'SET.MRPT_SOURCE_DIR "(.*)".', data)
-            if m:
-                # Source isn't installed, so no real point in fixing this..
-                data = data.replace(m.group(0), 'SET(MRPT_SOURCE_DIR "%s")'%cf.adjust_path(self.source_folder))
-
-            m = re.search(r'SET.MRPT_LIBS_INCL_DIR "(?P<CONAN_ROOT>(?P<base>.*?).(?P<type>(build|package)).(?P<hash>\w+).)(?P<rest>.*?(?="))".', data)
-            if m:
-                # This one is weird, though I swear this used to work, now it
-                # points to a non-existent path.  Specifically, it points to
-                # <base>/mrpt/libs, when stuff is found at <base>/libs.
-                # So, do some checking here to see what should be the right path.
-                lib_inc_path = None
-                if os.path.exists(os.path.join(self.package_folder, *(m.group('rest').split('/')))):
-                    lib_inc_path = m.group('rest')
-                    self.output.info('Default MRPT_LIBS_INCL_DIR was found, using %s'%lib_inc_path)
-                else:
-                    # Check for the leading mrpt, and remove it
-                    parts = m.group('rest').split('/')
-                    if parts[0] == 'mrpt':
-                        if not os.path.join(self.package_folder, *parts[1:]):
-                            raise ConanException('Could not find MRPT_LIBS_INCL_DIR at %s or %s'%(m.group('rest'), '/'.join(parts[1:])))
-                        lib_inc_path = '/'.join(parts[1:]) # cmake always prefers '/'
-                        self.output.info('Modified MRPT_LIBS_INCL_DIR was found, using %s'%lib_inc_path)
-
-                if lib_inc_path is None:
-                    raise ConanException('Could not find suitable MRPT_LIBS_INCL_DIR')
-                data = data.replace(m.group(0), 'SET(MRPT_LIBS_INCL_DIR "${CONAN_MRPT_ROOT}/%s")'%lib_inc_path)
-            else:
-                self.output.warn('Could not repair MRPT_LIBS_INCL_DIR variable')
-
-            m = re.search(r'SET.MRPT_CONFIG_DIR "(?P<CONAN_ROOT>(?P<base>.*?).(?P<type>(build|package)).(?P<hash>\w+).)(?P<rest>.*?(?="))".', data)
-            if m:
-                # Similar to above, the specified path [on Windows],
-                # <base>/include/mrpt-config/win32/ doesn't exist, and the
-                # files seem to actually be in <base>/include/mrpt/mrpt-config/
-                # So, check if the specified one exists, and if not, attempt the backup
-                mrpt_config_path = None
-                if os.path.exists(os.path.join(self.package_folder, *(m.group('rest').split('/')))):
-                    mrpt_config_path = m.group('rest')
-                    self.output.info('Default MRPT_CONFIG_DIR was found, using %s'%mrpt_config_path)
-                else:
-                    if os.path.exists(os.path.join(self.package_folder, 'include', 'mrpt', 'mrpt-config')):
-                        mrpt_config_path = '/'.join(['include', 'mrpt', 'mrpt-config']) # cmake prefers '/'
-                        self.output.info('Modified MRPT_CONFIG_DIR was found, using %s'%mrpt_config_path)
-
-                if mrpt_config_path is None:
-                    raise ConanException('Could not find suitable MRPT_CONFIG_DIR')
-
-                data = data.replace(m.group(0), 'SET(MRPT_CONFIG_DIR "${CONAN_MRPT_ROOT}/%s")'%mrpt_config_path)
-            else:
-                self.output.warn('Could not repair MRPT_CONFIG_DIR variable')
-
-            m = re.search(r'SET.MRPT_DIR "(?P<CONAN_ROOT>(?P<base>.*?).(?P<type>(build|package)).(?P<hash>\w+).)(?P<rest>.*?(?="))".', data)
-            if m:
-                data = data.replace(m.group(0), 'SET(MRPT_DIR "${CONAN_MRPT_ROOT}")')
-
-            m = re.search(r'INCLUDE_DIRECTORIES\("(?P<path>.*?eigen[^"]+)"\)', data)
-            if m:
-                data = data.replace(m.group(0), 'list(APPEND MRPT_INCLUDE_DIRS "${CONAN_INCLUDE_DIRS_EIGEN}")')
-            else:
-                self.output.warn('Could not repair reference to Eigen include directory in MRPTConfig.cmake')
-
-            m = re.search(r'INCLUDE_DIRECTORIES\(\${MRPT_CONFIG_DIR}\)', data)
-            if m:
-                data = data.replace(m.group(0), 'list(APPEND MRPT_INCLUDE_DIRS "${MRPT_CONFIG_DIR}")')
-            else:
-                self.output.warn('Could not repair reference to MRPT CONFIG directory in MRPTConfig.cmake')
-
-            m = re.search(r'LINK_DIRECTORIES\(""\)', data)
-            if m:
-                data = data.replace(m.group(0), '# ' + m.group(0))
-            else:
-                self.output.warn('Could not comment out empty link_directories directive in MRPTConfig.cmake')
-
-            m = re.search(r'INCLUDE_DIRECTORIES\("(?P<suitesparse>[^"]+)"\) # SuiteSparse\w+', data)
-            if m:
-                # Note: We may want to replace this with a Conan package for
-                # SuiteSparse in the future, especially considering by default
-                # this points at the wrong place anyways.
-                data = data.replace(m.group(0), 'list(APPEND MRPT_INCLUDE_DIRS "%s") # SuiteSparse_INCLUDE_DIRS'%m.group('suitesparse'))
-            else:
-                self.output.warn('Could not repair reference to SuiteSparse directory in MRPTConfig.cmake')
-
-            m = re.search(r'INCLUDE_DIRECTORIES\("(?P<path>\${MRPT_LIBS_INCL_DIR}/\${MRPTLIB}/include)"\)', data)
-            if m:
-                data = data.replace(m.group(0), 'list(APPEND MRPT_INCLUDE_DIRS "%s")'%m.group('path'))
-            else:
-                self.output.warn('Could not repair reference to MRPT include directory in MRPTConfig.cmake')
-
-            m = re.search(r'(?=\w)LINK_DIRECTORIES\(\${wxWidgets_LIBRARY_DIRS}\)', data)
-            if m:
-                data = data.replace(m.group(0), 'list(APPEND MRPT_INCLUDE_DIRS "%s")'%'${wxWidgets_LIBRARY_DIRS}')
-            else:
-                self.output.warn('Could not repair the link to wxWidget in MRPTConfig.cmake')
-
-            m = re.search(r'(?P<first>LINK_DIRECTORIES\("/lib"\))\s+LINK_DIRECTORIES\("/lib"\)', data, re.MULTILINE)
-            if m:
-                data = data.replace(m.group(0), m.group('first'))
-            else:
-                self.output.warn('Could not remove the duplicate link directories in MRPTConfig.cmake')
+        data, rules_report = self._apply_find_package_rules(data, rules)
+        report.update(rules_report)
 
-            m = re.search(r'LINK_DIRECTORIES\((?P<lib>\${MRPT_DIR}/lib)\)', data)
-            if m:
-                data = data.replace(m.group(0), 'list(APPEND MRPT_LINK_DIRECTORIES "%s")'%m.group('lib'))
-            else:
-                self.output.warn('Could not repair link to MRPT libs in MRPTConfig.cmake')
+        if self._single_library:
+            data += '''
 
-            # Now, replace any free floating conan path, just in case some were missed here
-            data = data.replace(self.package_folder, '${CONAN_MRPT_ROOT}')
-            data = data.replace(cf.adjust_path(self.package_folder), '${CONAN_MRPT_ROOT}')
+# Added by conan: the MRPT libraries are all linked in to libmrpt
+set(MRPT_LIBS mrpt)'''
 
+        if mrpt_version <= '2':
             data += '''
 
 # Defining for forward-compatiblity
@@ -508,4 +2394,92 @@ set(MRPT_LIBRARIES ${MRPT_LIBS})'''
         self.output.info('Outputting modified %s'%dst)
         with open(dst, 'w+') as f: f.write(data)
 
+        return report
+
+    def _apply_find_package_rules(self, data, rules):
+        """
+        Apply the rewrite rules to data in a single scan, by combining all of
+        their patterns into one alternation (the rules' groups are prefixed
+        to keep them apart.)  Where two rules could match at the same spot,
+        the one listed first wins.
+
+        @param data Contents of MRPTConfig.cmake
+        @param rules List of FindPackageRule
+        @return (rewritten data, {rule name: number of matches})
+        """
+
+        start = time.time()
+        master = _compile_find_package_rules(tuple(r.pattern for r in rules))
+        report = {r.name: 0 for r in rules}
+        variables = {
+            'source_folder':  self._adjust_path(self.source_folder),
+            'package_folder': self._adjust_path(self.package_folder),
+        }
+
+        def substitute(m):
+            i = int(m.lastgroup[1:])
+            rule = rules[i]
+            prefix = f'r{i}_'
+            groups = {k[len(prefix):]: v for k,v in m.groupdict().items() if k.startswith(prefix) and v is not None}
+            report[rule.name] += 1
+            if callable(rule.replace):
+                return rule.replace(self, groups)
+            return rule.replace%dict(variables, **groups)
+
+        data = master.sub(substitute, data)
+
+        for r in rules:
+            if not report[r.name] and r.warning:
+                self.output.warn(r.warning + ' in MRPTConfig.cmake')
+        self.output.info('Applied %d/%d MRPTConfig.cmake rules in %.1fms: %s'%(
+            sum(1 for n in report.values() if n), len(rules), 1000 * (time.time() - start),
+            ', '.join(f'{k}={v}' for k,v in report.items())
+        ))
+
+        return data, report
+
+    def _fix_libs_incl_dir(self, groups):
+        """ Replacement for the MRPT_LIBS_INCL_DIR rule """
+
+        # This one is weird, though I swear this used to work, now it
+        # points to a non-existent path.  Specifically, it points to
+        # <base>/mrpt/libs, when stuff is found at <base>/libs.
+        # So, do some checking here to see what should be the right path.
+        lib_inc_path = None
+        if os.path.exists(os.path.join(self.package_folder, *(groups['rest'].split('/')))):
+            lib_inc_path = groups['rest']
+            self.output.info('Default MRPT_LIBS_INCL_DIR was found, using %s'%lib_inc_path)
+        else:
+            # Check for the leading mrpt, and remove it
+            parts = groups['rest'].split('/')
+            if parts[0] == 'mrpt':
+                if not os.path.join(self.package_folder, *parts[1:]):
+                    raise ConanException('Could not find MRPT_LIBS_INCL_DIR at %s or %s'%(groups['rest'], '/'.join(parts[1:])))
+                lib_inc_path = '/'.join(parts[1:]) # cmake always prefers '/'
+                self.output.info('Modified MRPT_LIBS_INCL_DIR was found, using %s'%lib_inc_path)
+
+        if lib_inc_path is None:
+            raise ConanException('Could not find suitable MRPT_LIBS_INCL_DIR')
+        return 'SET(MRPT_LIBS_INCL_DIR "${CONAN_MRPT_ROOT}/%s")'%lib_inc_path
+
+    def _fix_config_dir(self, groups):
+        """ Replacement for the MRPT_CONFIG_DIR rule """
+
+        # Similar to above, the specified path [on Windows],
+        # <base>/include/mrpt-config/win32/ doesn't exist, and the
+        # files seem to actually be in <base>/include/mrpt/mrpt-config/
+        # So, check if the specified one exists, and if not, attempt the backup
+        mrpt_config_path = None
+        if os.path.exists(os.path.join(self.package_folder, *(groups['rest'].split('/')))):
+            mrpt_config_path = groups['rest']
+            self.output.info('Default MRPT_CONFIG_DIR was found, using %s'%mrpt_config_path)
+        else:
+            if os.path.exists(os.path.join(self.package_folder, 'include', 'mrpt', 'mrpt-config')):
+                mrpt_config_path = '/'.join(['include', 'mrpt', 'mrpt-config']) # cmake prefers '/'
+                self.output.info('Modified MRPT_CONFIG_DIR was found, using %s'%mrpt_config_path)
+
+        if mrpt_config_path is None:
+            raise ConanException('Could not find suitable MRPT_CONFIG_DIR')
+        return 'SET(MRPT_CONFIG_DIR "${CONAN_MRPT_ROOT}/%s")'%mrpt_config_path
+
 # vim: ts=4 sw=4 expandtab ffs=unix ft=python foldmethod=marker :
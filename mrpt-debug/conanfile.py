@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: future_fstrings -*-
+# -*- coding: utf-8 -*-
+
+import os
+from conans import ConanFile
+from conans.errors import ConanException
+
+
+class MrptDebugConan(ConanFile):
+    """
+    The debug info of an mrpt package built with debug_info=split, which
+    leaves it out of the mrpt package itself so that deployments don't
+    download it.  Nothing is built, the debug info is packaged from the mrpt
+    build folder (MrptConan._debug_symbols_folder):
+
+        conan export-pkg mrpt-debug mrpt-debug/1.5.6@ntc/stable
+            --build-folder=~/.conan/data/mrpt/1.5.6/ntc/stable/build/<id>
+            -s ... -o mrpt:...
+
+    (one command) with the settings and options of the mrpt build.  Install
+    it where the symbols are needed, and point gdb at it:
+
+        gdb -iex "set debug-file-directory <debug_file_directory>" ...
+
+    debug_file_directory is in the user_info, it also works for other
+    tools that look the debug info up by build ID (eu-stack, ...)
+    """
+
+    name        = 'mrpt-debug'
+    license     = 'BSD'
+    url         = 'http://www.mrpt.org/'
+    description = 'Debug info of the MRPT libraries built with debug_info=split'
+    settings    = 'os', 'compiler', 'build_type', 'arch'
+    default_options = 'mrpt:debug_info=split'
+
+    def requirements(self):
+        self.requires(f'mrpt/{self.version}@{self.user}/{self.channel}')
+
+    def package_id(self):
+        # One for every mrpt binary, the debug info matches it exactly
+        self.info.requires['mrpt'].full_package_mode()
+
+    def package(self):
+        src = os.path.join(self.build_folder, 'debug_symbols')
+        if not os.path.isdir(src):
+            raise ConanException(f'No debug info in {src}, is this the build folder of mrpt with debug_info=split?')
+        self.copy('*.debug', src=src, dst='.', keep_path=True)
+
+    def package_info(self):
+        self.user_info.debug_file_directory = os.path.join(self.package_folder, 'lib', 'debug')
+
+# vim: ts=4 sw=4 expandtab ffs=unix ft=python foldmethod=marker :
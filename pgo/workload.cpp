@@ -0,0 +1,274 @@
+/**
+ * Representative MRPT workload used to train the profile of a PGO build.
+ *
+ * Everything runs on synthetic data (a fixed seed, so the profile is
+ * reproducible), and exercises the paths we care about in our SLAM stack:
+ * ICP, point cloud and occupancy grid map insertion, particle filter
+ * localization and image processing.  The sections are compiled in depending
+ * on which MRPT libraries were built (WORKLOAD_WITH_<LIB>).
+ */
+
+#include <cmath>
+#include <cstdlib>
+#include <iostream>
+#include <random>
+
+#include <mrpt/version.h>
+#include <mrpt/poses/CPose2D.h>
+#include <mrpt/poses/CPose3D.h>
+#include <mrpt/utils/CImage.h>
+#include <mrpt/utils/CMemoryStream.h>
+
+#if defined(WORKLOAD_WITH_MAPS)
+#  if MRPT_VERSION >= 0x130
+#    include <mrpt/maps/CSimplePointsMap.h>
+#    include <mrpt/maps/COccupancyGridMap2D.h>
+#    include <mrpt/obs/CObservation2DRangeScan.h>
+#  else
+#    include <mrpt/slam/CSimplePointsMap.h>
+#    include <mrpt/slam/COccupancyGridMap2D.h>
+#    include <mrpt/slam/CObservation2DRangeScan.h>
+#  endif
+#endif
+
+#if defined(WORKLOAD_WITH_SLAM)
+#  include <mrpt/slam/CICP.h>
+#  include <mrpt/slam/CMonteCarloLocalization2D.h>
+#  include <mrpt/bayes/CParticleFilter.h>
+#  if MRPT_VERSION >= 0x130
+#    include <mrpt/obs/CActionCollection.h>
+#    include <mrpt/obs/CActionRobotMovement2D.h>
+#    include <mrpt/obs/CSensoryFrame.h>
+#  else
+#    include <mrpt/slam/CActionCollection.h>
+#    include <mrpt/slam/CActionRobotMovement2D.h>
+#    include <mrpt/slam/CSensoryFrame.h>
+#  endif
+#endif
+
+#if defined(WORKLOAD_WITH_VISION)
+#  include <mrpt/vision/CFeatureExtraction.h>
+#endif
+
+using namespace mrpt::poses;
+using namespace mrpt::utils;
+#if MRPT_VERSION >= 0x130
+#  if defined(WORKLOAD_WITH_MAPS)
+using namespace mrpt::maps;
+using namespace mrpt::obs;
+#  endif
+#endif
+#if defined(WORKLOAD_WITH_SLAM) || (defined(WORKLOAD_WITH_MAPS) && MRPT_VERSION < 0x130)
+using namespace mrpt::slam;
+#endif
+#if defined(WORKLOAD_WITH_SLAM)
+using namespace mrpt::bayes;
+#endif
+
+namespace
+{
+
+std::mt19937 rng(42);
+
+#if defined(WORKLOAD_WITH_MAPS)
+/** Simulated 2D laser scan of a rectangular room with a few pillars, as seen from pose */
+CObservation2DRangeScan syntheticScan(const CPose2D &pose, size_t n = 361)
+{
+    std::normal_distribution<float> noise(0.0f, 0.01f);
+
+    CObservation2DRangeScan scan;
+    scan.aperture    = M_PI;
+    scan.rightToLeft = true;
+    scan.maxRange    = 30.0f;
+#if MRPT_VERSION >= 0x150
+    scan.resizeScan(n);
+#else
+    scan.scan.resize(n);
+    scan.validRange.resize(n);
+#endif
+
+    for (size_t i = 0; i < n; ++i)
+    {
+        const double a = pose.phi() - M_PI / 2 + M_PI * i / (n - 1);
+        const double dx = std::cos(a), dy = std::sin(a);
+
+        // Distance to the walls of a 20x12 room centred on the origin
+        double r = 30.0;
+        if (std::abs(dx) > 1e-9) r = std::min(r, ((dx > 0 ? 10.0 : -10.0) - pose.x()) / dx);
+        if (std::abs(dy) > 1e-9) r = std::min(r, ((dy > 0 ?  6.0 :  -6.0) - pose.y()) / dy);
+
+        // Pillars every 4m along x
+        for (double px = -8.0; px <= 8.0; px += 4.0)
+        {
+            const double ox = px - pose.x(), oy = 2.0 - pose.y();
+            const double t = ox * dx + oy * dy;
+            const double d2 = ox * ox + oy * oy - t * t;
+            if (t > 0 && d2 < 0.09) r = std::min(r, t - std::sqrt(0.09 - d2));
+        }
+
+        const float range = static_cast<float>(r) + noise(rng);
+#if MRPT_VERSION >= 0x150
+        scan.setScanRange(i, range);
+        scan.setScanRangeValidity(i, range < scan.maxRange);
+#else
+        scan.scan[i]       = range;
+        scan.validRange[i] = range < scan.maxRange;
+#endif
+    }
+    return scan;
+}
+#endif
+
+/** Textured synthetic image, gradients plus noise plus a grid of squares */
+CImage syntheticImage(size_t w = 640, size_t h = 480)
+{
+    std::uniform_int_distribution<int> noise(0, 40);
+
+    CImage img(w, h, CH_GRAY);
+    for (size_t y = 0; y < h; ++y)
+        for (size_t x = 0; x < w; ++x)
+        {
+            const bool square = ((x / 40) + (y / 40)) % 2 == 0;
+            const int v = (square ? 160 : 60) + static_cast<int>(x * 30 / w) + noise(rng);
+            *img(x, y) = static_cast<unsigned char>(std::min(v, 255));
+        }
+    return img;
+}
+
+void poseComposition(size_t iterations)
+{
+    std::uniform_real_distribution<double> u(-1.0, 1.0);
+    CPose3D acc;
+    for (size_t i = 0; i < iterations; ++i)
+    {
+        const CPose3D inc(u(rng), u(rng), u(rng), 0.1 * u(rng), 0.1 * u(rng), 0.1 * u(rng));
+        acc = acc + inc;
+        acc = acc - CPose3D(0, 0, 0, 0.05, 0, 0);
+    }
+    std::cout << " pose composition: " << acc << std::endl;
+}
+
+void imageProcessing(size_t iterations)
+{
+    for (size_t i = 0; i < iterations; ++i)
+    {
+        CImage img = syntheticImage();
+        img.filterGaussianInPlace(5, 5);
+        img.scaleImage(320, 240);
+
+        // JPEG round trip, as done for rawlogs
+        CMemoryStream buf;
+        img.saveToStreamAsJPEG(buf, 90);
+        buf.Seek(0);
+        CImage decoded;
+        decoded.loadFromStreamAsJPEG(buf);
+
+#if defined(WORKLOAD_WITH_VISION)
+        mrpt::vision::CFeatureExtraction fe;
+        fe.options.featsType = mrpt::vision::featFAST;
+        mrpt::vision::CFeatureList feats;
+        fe.detectFeatures(syntheticImage(), feats, 0, 300);
+#endif
+    }
+    std::cout << " image processing: " << iterations << " images" << std::endl;
+}
+
+#if defined(WORKLOAD_WITH_MAPS)
+void mapInsertion(size_t iterations, COccupancyGridMap2D &grid)
+{
+    CSimplePointsMap points;
+    for (size_t i = 0; i < iterations; ++i)
+    {
+        const CPose2D pose(-6.0 + 12.0 * i / iterations, 0.5 * std::sin(0.1 * i), 0.05 * i);
+        const CObservation2DRangeScan scan = syntheticScan(pose);
+        const CPose3D pose3D(pose);
+        points.insertObservation(&scan, &pose3D);
+        grid.insertObservation(&scan, &pose3D);
+    }
+    std::cout << " map insertion: " << points.size() << " points" << std::endl;
+}
+#endif
+
+#if defined(WORKLOAD_WITH_SLAM)
+void icp(size_t iterations)
+{
+    for (size_t i = 0; i < iterations; ++i)
+    {
+        const CPose2D a(0.0, 0.0, 0.0), b(0.3, -0.1, 0.05);
+        const CObservation2DRangeScan sa = syntheticScan(a), sb = syntheticScan(b);
+
+        CSimplePointsMap ma, mb;
+        ma.insertObservation(&sa);
+        mb.insertObservation(&sb);
+
+        CICP icp;
+        icp.options.ICP_algorithm = (i % 2) ? icpLevenbergMarquardt : icpClassic;
+        icp.options.maxIterations = 100;
+
+        float runningTime;
+        CICP::TReturnInfo info;
+        icp.Align(&ma, &mb, CPose2D(0, 0, 0), &runningTime, &info);
+        icp.Align3D(&ma, &mb, CPose3D(0, 0, 0, 0, 0, 0), &runningTime, &info);
+    }
+    std::cout << " ICP: " << iterations << " alignments" << std::endl;
+}
+
+void particleFilter(size_t steps, COccupancyGridMap2D &grid)
+{
+    const size_t particles = 2000;
+
+    CMonteCarloLocalization2D pdf(particles);
+    pdf.options.metricMap = &grid;
+    pdf.resetUniformFreeSpace(&grid, 0.7, particles);
+
+    CParticleFilter pf;
+    pf.m_options.PF_algorithm     = CParticleFilter::pfStandardProposal;
+    pf.m_options.resamplingMethod = CParticleFilter::prSystematic;
+
+    CActionRobotMovement2D::TMotionModelOptions motion;
+    CPose2D pose(-6.0, 0.0, 0.0);
+    for (size_t i = 0; i < steps; ++i)
+    {
+        const CPose2D odometry(0.1, 0.0, 0.01);
+        pose = pose + odometry;
+
+        CActionRobotMovement2D act;
+        act.computeFromOdometry(odometry, motion);
+        CActionCollection acts;
+        acts.insert(act);
+
+        CObservation2DRangeScanPtr obs = CObservation2DRangeScan::Create();
+        *obs = syntheticScan(pose);
+        CSensoryFrame sf;
+        sf.insert(obs);
+
+        pf.executeOn(pdf, &acts, &sf);
+    }
+    std::cout << " particle filter: " << steps << " steps, estimate " << pdf.getMeanVal() << std::endl;
+}
+#endif
+
+} // namespace
+
+int main(int argc, char **argv)
+{
+    // Scale of the workload, the default takes on the order of a minute
+    const size_t scale = (argc > 1) ? std::strtoul(argv[1], nullptr, 10) : 10;
+
+    std::cout << "MRPT 0x" << std::hex << MRPT_VERSION << std::dec << " PGO training workload" << std::endl;
+
+    poseComposition(100000 * scale);
+    imageProcessing(5 * scale);
+
+#if defined(WORKLOAD_WITH_MAPS)
+    COccupancyGridMap2D grid(-11.0f, 11.0f, -7.0f, 7.0f, 0.05f);
+    mapInsertion(20 * scale, grid);
+#endif
+
+#if defined(WORKLOAD_WITH_SLAM)
+    icp(5 * scale);
+    particleFilter(10 * scale, grid);
+#endif
+
+    return 0;
+}
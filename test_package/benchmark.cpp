@@ -0,0 +1,303 @@
+/**
+ * Benchmarks of the MRPT hot paths we depend on, on synthetic data.
+ *
+ * Writes the results as JSON to the file given as the first argument, which
+ * test_package then compares against its baseline.  The map and SLAM
+ * benchmarks are only compiled in if those libraries were built
+ * (BENCH_WITH_<LIB>).
+ */
+
+#define _USE_MATH_DEFINES
+#include <algorithm>
+#include <chrono>
+#include <cmath>
+#include <fstream>
+#include <iostream>
+#include <map>
+#include <random>
+#include <string>
+#include <vector>
+
+#include <mrpt/version.h>
+#include <mrpt/poses/CPose2D.h>
+#include <mrpt/poses/CPose3D.h>
+#include <mrpt/utils/CImage.h>
+#include <mrpt/utils/CMemoryStream.h>
+
+#if defined(BENCH_WITH_MAPS)
+#  if MRPT_VERSION >= 0x130
+#    include <mrpt/maps/CSimplePointsMap.h>
+#    include <mrpt/maps/COccupancyGridMap2D.h>
+#    include <mrpt/obs/CObservation2DRangeScan.h>
+using namespace mrpt::maps;
+using namespace mrpt::obs;
+#  else
+#    include <mrpt/slam/CSimplePointsMap.h>
+#    include <mrpt/slam/COccupancyGridMap2D.h>
+#    include <mrpt/slam/CObservation2DRangeScan.h>
+using namespace mrpt::slam;
+#  endif
+#endif
+
+#if defined(BENCH_WITH_SLAM)
+#  include <mrpt/slam/CICP.h>
+#endif
+
+using namespace mrpt::poses;
+using namespace mrpt::utils;
+
+namespace
+{
+
+std::mt19937 rng(42);
+
+struct Result
+{
+    size_t repetitions;
+    double median_ms;
+    double min_ms;
+    double mpix_per_s; ///< Throughput of the image benchmarks, 0 for the others
+};
+
+std::map<std::string, Result> results;
+
+/** Time fn (after one warm up run), and record the median and minimum */
+template <typename Fn>
+void bench(const std::string &name, size_t repetitions, Fn fn)
+{
+    fn();
+
+    std::vector<double> times;
+    for (size_t i = 0; i < repetitions; ++i)
+    {
+        const auto start = std::chrono::steady_clock::now();
+        fn();
+        const auto end = std::chrono::steady_clock::now();
+        times.push_back(std::chrono::duration<double, std::milli>(end - start).count());
+    }
+    std::sort(times.begin(), times.end());
+
+    const Result r = {repetitions, times[times.size() / 2], times.front(), 0.0};
+    results[name] = r;
+    std::cout << " " << name << ": " << r.median_ms << " ms (min " << r.min_ms << " ms)" << std::endl;
+}
+
+/** Record the throughput of an image benchmark, from its median time */
+void throughput(const std::string &name, size_t pixels)
+{
+    Result &r = results[name];
+    r.mpix_per_s = pixels / 1e6 / (r.median_ms / 1e3);
+    std::cout << " " << name << ": " << r.mpix_per_s << " Mpixels/s" << std::endl;
+}
+
+/** Keep the optimizer from dropping a computation */
+volatile double sink = 0;
+
+#if defined(BENCH_WITH_MAPS)
+/** Simulated 2D laser scan of a 20x12m room, as seen from pose */
+CObservation2DRangeScan syntheticScan(const CPose2D &pose, size_t n = 361)
+{
+    std::normal_distribution<float> noise(0.0f, 0.01f);
+
+    CObservation2DRangeScan scan;
+    scan.aperture    = M_PI;
+    scan.rightToLeft = true;
+    scan.maxRange    = 30.0f;
+#if MRPT_VERSION >= 0x150
+    scan.resizeScan(n);
+#else
+    scan.scan.resize(n);
+    scan.validRange.resize(n);
+#endif
+
+    for (size_t i = 0; i < n; ++i)
+    {
+        const double a = pose.phi() - M_PI / 2 + M_PI * i / (n - 1);
+        const double dx = std::cos(a), dy = std::sin(a);
+
+        double r = 30.0;
+        if (std::abs(dx) > 1e-9) r = std::min(r, ((dx > 0 ? 10.0 : -10.0) - pose.x()) / dx);
+        if (std::abs(dy) > 1e-9) r = std::min(r, ((dy > 0 ?  6.0 :  -6.0) - pose.y()) / dy);
+
+        const float range = static_cast<float>(r) + noise(rng);
+#if MRPT_VERSION >= 0x150
+        scan.setScanRange(i, range);
+        scan.setScanRangeValidity(i, range < scan.maxRange);
+#else
+        scan.scan[i]       = range;
+        scan.validRange[i] = range < scan.maxRange;
+#endif
+    }
+    return scan;
+}
+#endif
+
+/** Textured synthetic image */
+CImage syntheticImage(size_t w = 640, size_t h = 480)
+{
+    std::uniform_int_distribution<int> noise(0, 40);
+
+    CImage img(w, h, CH_RGB);
+    for (size_t y = 0; y < h; ++y)
+        for (size_t x = 0; x < w; ++x)
+        {
+            const bool square = ((x / 40) + (y / 40)) % 2 == 0;
+            for (unsigned int c = 0; c < 3; ++c)
+            {
+                const int v = (square ? 160 : 60) + static_cast<int>((x + c * 100) * 30 / w) + noise(rng);
+                *img(x, y, c) = static_cast<unsigned char>(std::min(v, 255));
+            }
+        }
+    return img;
+}
+
+void writeJson(const std::string &path)
+{
+    std::ofstream f(path.c_str());
+    f << "{\n  \"mrpt_version\": \"0x" << std::hex << MRPT_VERSION << std::dec << "\",\n";
+    f << "  \"benchmarks\": {";
+    for (auto it = results.begin(); it != results.end(); ++it)
+    {
+        f << (it == results.begin() ? "\n" : ",\n");
+        f << "    \"" << it->first << "\": {\"repetitions\": " << it->second.repetitions
+          << ", \"median_ms\": " << it->second.median_ms << ", \"min_ms\": " << it->second.min_ms;
+        if (it->second.mpix_per_s > 0)
+            f << ", \"mpix_per_s\": " << it->second.mpix_per_s;
+        f << "}";
+    }
+    f << "\n  }\n}\n";
+}
+
+} // namespace
+
+int main(int argc, char **argv)
+{
+    const std::string output = (argc > 1) ? argv[1] : "benchmark_results.json";
+
+    std::cout << "MRPT benchmarks:" << std::endl;
+
+    // Pose composition
+    {
+        std::uniform_real_distribution<double> u(-1.0, 1.0);
+        std::vector<CPose3D> incs;
+        for (size_t i = 0; i < 1000; ++i)
+            incs.push_back(CPose3D(u(rng), u(rng), u(rng), 0.1 * u(rng), 0.1 * u(rng), 0.1 * u(rng)));
+
+        bench("pose_composition_3d", 20, [&]() {
+            CPose3D acc;
+            for (size_t k = 0; k < 100; ++k)
+                for (size_t i = 0; i < incs.size(); ++i)
+                    acc = acc + incs[i];
+            sink = acc.x();
+        });
+    }
+
+    // JPEG decode (and encode), through whichever libjpeg MRPT links to
+    {
+        const CImage img = syntheticImage();
+        CMemoryStream jpeg;
+        img.saveToStreamAsJPEG(jpeg, 90);
+
+        bench("jpeg_decode_640x480", 50, [&]() {
+            jpeg.Seek(0);
+            CImage decoded;
+            decoded.loadFromStreamAsJPEG(jpeg);
+            sink = decoded.getWidth();
+        });
+        throughput("jpeg_decode_640x480", 640 * 480);
+    }
+    {
+        const CImage img = syntheticImage(1920, 1080);
+        CMemoryStream jpeg;
+        img.saveToStreamAsJPEG(jpeg, 90);
+
+        bench("jpeg_decode_1920x1080", 20, [&]() {
+            jpeg.Seek(0);
+            CImage decoded;
+            decoded.loadFromStreamAsJPEG(jpeg);
+            sink = decoded.getWidth();
+        });
+        throughput("jpeg_decode_1920x1080", 1920 * 1080);
+
+        bench("jpeg_encode_1920x1080", 20, [&]() {
+            CMemoryStream out;
+            img.saveToStreamAsJPEG(out, 90);
+            sink = out.getTotalBytesCount();
+        });
+        throughput("jpeg_encode_1920x1080", 1920 * 1080);
+    }
+
+#if defined(BENCH_WITH_MAPS)
+    std::vector<CObservation2DRangeScan> scans;
+    std::vector<CPose3D> poses;
+    for (size_t i = 0; i < 100; ++i)
+    {
+        const CPose2D pose(-6.0 + 0.12 * i, 0.5 * std::sin(0.1 * i), 0.05 * i);
+        scans.push_back(syntheticScan(pose));
+        poses.push_back(CPose3D(pose));
+    }
+
+    bench("point_map_insert", 10, [&]() {
+        CSimplePointsMap points;
+        for (size_t i = 0; i < scans.size(); ++i)
+            points.insertObservation(&scans[i], &poses[i]);
+        sink = points.size();
+    });
+
+    bench("occupancy_grid_insert", 10, [&]() {
+        COccupancyGridMap2D grid(-11.0f, 11.0f, -7.0f, 7.0f, 0.05f);
+        for (size_t i = 0; i < scans.size(); ++i)
+            grid.insertObservation(&scans[i], &poses[i]);
+        sink = grid.getXMax();
+    });
+
+    {
+        CSimplePointsMap points;
+        for (size_t i = 0; i < scans.size(); ++i)
+            points.insertObservation(&scans[i], &poses[i]);
+
+        std::uniform_real_distribution<float> ux(-10.0f, 10.0f), uy(-6.0f, 6.0f);
+        std::vector<std::pair<float, float> > queries;
+        for (size_t i = 0; i < 10000; ++i)
+            queries.push_back(std::make_pair(ux(rng), uy(rng)));
+
+        // The first query builds the KD-tree (during the warm up)
+        bench("kdtree_query_2d", 20, [&]() {
+            float x, y, d2;
+            for (size_t i = 0; i < queries.size(); ++i)
+                sink = points.kdTreeClosestPoint2D(queries[i].first, queries[i].second, x, y, d2);
+        });
+        bench("kdtree_query_3d", 20, [&]() {
+            float x, y, z, d2;
+            for (size_t i = 0; i < queries.size(); ++i)
+                sink = points.kdTreeClosestPoint3D(queries[i].first, queries[i].second, 0.0f, x, y, z, d2);
+        });
+    }
+#endif
+
+#if defined(BENCH_WITH_SLAM)
+    {
+        CSimplePointsMap a, b;
+        const CObservation2DRangeScan sa = syntheticScan(CPose2D(0.0, 0.0, 0.0));
+        const CObservation2DRangeScan sb = syntheticScan(CPose2D(0.3, -0.1, 0.05));
+        a.insertObservation(&sa);
+        b.insertObservation(&sb);
+
+        mrpt::slam::CICP icp;
+        icp.options.maxIterations = 100;
+
+        bench("icp_2d", 20, [&]() {
+            float runningTime;
+            sink = icp.Align(&a, &b, CPose2D(0, 0, 0), &runningTime)->getMeanVal().x();
+        });
+        bench("icp_3d", 20, [&]() {
+            float runningTime;
+            sink = icp.Align3D(&a, &b, CPose3D(0, 0, 0, 0, 0, 0), &runningTime)->getMeanVal().x();
+        });
+    }
+#endif
+
+    writeJson(output);
+    std::cout << "Wrote " << output << std::endl;
+    return 0;
+}
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# -*- coding: future_fstrings -*-
+# -*- coding: utf-8 -*-
+
+import os, re, json, time, subprocess
+from conans import ConanFile, CMake, tools
+from conans.errors import ConanException
+
+
+# The mrpt options meant to speed up the start up, with their defaults (the
+# "before" of _report_startup_times)
+STARTUP_OPTIONS = {
+    'symbol_visibility': 'default',
+    'fast_linking':      'False',
+    'single_library':    'False',
+}
+
+
+class MrptTestConan(ConanFile):
+    settings   = 'os', 'compiler', 'build_type', 'arch'
+    generators = 'cmake'
+
+    def build(self):
+        cmake = CMake(self)
+        cmake.definitions['MRPT_DIR:PATH'] = self.deps_cpp_info['mrpt'].resdirs[0]
+
+        # Only benchmark what was built
+        built = self.deps_user_info['mrpt'].modules.split(',')
+        cmake.definitions['MRPT_BENCH_MODULES:STRING'] = ';'.join(m for m in ['base', 'obs', 'maps', 'slam'] if m in built)
+        cmake.configure()
+        cmake.build()
+
+    def test(self):
+        if tools.cross_building(self.settings):
+            return
+
+        self.run(os.path.join('.', 'bin', 'example'), run_environment=True)
+        self._report_build_times()
+
+        results_file = os.path.join(self.build_folder, 'benchmark_results.json')
+        self.run('%s %s'%(os.path.join('.', 'bin', 'benchmark'), results_file), run_environment=True)
+        self._add_startup_benchmarks(results_file)
+        self._report_startup_times(results_file)
+        self._report_jpeg_throughput(results_file)
+        self._check_benchmarks(results_file)
+
+    def _add_startup_benchmarks(self, results_file, repetitions=10):
+        """
+        Time the start up of bin/example, which is mostly the dynamic loader
+        loading and relocating the MRPT libraries (see the symbol_visibility,
+        fast_linking and single_library options.)  glibc's
+        LD_DEBUG=statistics reports the loader's share of it.  The results
+        are added to the benchmark results and shown against the baseline,
+        but the timings (a few ms, too noisy on a shared machine) are only
+        reported; just the relocation count can fail the test.  See
+        _report_startup_times for the comparison across those options.
+        """
+
+        if self.settings.os != 'Linux':
+            return
+
+        example = os.path.join(self.build_folder, 'bin', 'example')
+        env = tools.RunEnvironment(self).vars
+        env['LD_DEBUG'] = 'statistics'
+
+        samples = {}
+        with tools.environment_append(env):
+            for _ in range(repetitions):
+                start = time.perf_counter()
+                p = subprocess.run([example], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+                elapsed = time.perf_counter() - start
+                if p.returncode:
+                    raise ConanException(f'{example} failed:\n{p.stderr}')
+                samples.setdefault(('startup_process', 'ms'), []).append(1000 * elapsed)
+
+                # Only the first block, the one at exit reports the final
+                # number of relocations (including the lazy ones)
+                m = re.search(r'total startup time in dynamic loader: ([\d.]+)\s*(\w+)', p.stderr)
+                if m:
+                    value, unit = float(m.group(1)), m.group(2)
+                    if 'us' == unit:
+                        value, unit = value / 1000, 'ms'
+                    samples.setdefault(('startup_dynamic_loader', unit), []).append(value)
+                m = re.search(r'number of relocations: (\d+)', p.stderr)
+                if m:
+                    samples.setdefault(('startup_relocations', 'count'), []).append(int(m.group(1)))
+
+        if ('startup_dynamic_loader', 'ms') not in samples and ('startup_dynamic_loader', 'cycles') not in samples:
+            self.output.warn('No LD_DEBUG statistics from the dynamic loader, only timing the whole start up')
+
+        with open(results_file) as f: data = json.load(f)
+        for (name, unit), values in samples.items():
+            values = sorted(values)
+            data['benchmarks'][name] = {'repetitions': len(values), f'median_{unit}': values[len(values) // 2]}
+            if 'count' != unit:
+                data['benchmarks'][name]['report_only'] = True
+        with open(results_file, 'w') as f: json.dump(data, f, indent=2, sort_keys=True)
+
+    def _report_startup_times(self, results_file):
+        """
+        Compare the start up of each combination of the options meant to
+        speed it up (STARTUP_OPTIONS) with the default one, i.e. before and
+        after.  The benchmark baseline can't, it's per combination.  The
+        latest results of each combination are kept in startup_times.json,
+        next to the benchmark baseline.
+        """
+
+        with open(results_file) as f: results = json.load(f)['benchmarks']
+        results = {n: r for n, r in results.items() if n.startswith('startup_')}
+        if not results:
+            return
+
+        options = dict(o.split('=', 1) for o in self.deps_user_info['mrpt'].benchmark_options.split(','))
+        startup_options = ','.join(f'{o}={options[o]}' for o in STARTUP_OPTIONS if o in options)
+        others = ','.join(f'{o}={v}' for o, v in options.items() if o not in STARTUP_OPTIONS)
+        key = '/'.join(self._baseline_settings + [others])
+        default = ','.join(f'{o}={v}' for o, v in STARTUP_OPTIONS.items() if o in options)
+
+        history_file = os.path.join(os.path.dirname(os.path.abspath(self._baseline_file)), 'startup_times.json')
+        history = {}
+        if os.path.exists(history_file):
+            with open(history_file) as f: history = json.load(f)
+        history.setdefault(key, {})[startup_options] = results
+        if not os.path.isdir(os.path.dirname(history_file)):
+            os.makedirs(os.path.dirname(history_file))
+        with open(history_file, 'w') as f: json.dump(history, f, indent=2, sort_keys=True)
+
+        names = sorted(results)
+        before = history[key].get(default, {})
+        s = f'\nMRPT start up by {", ".join(STARTUP_OPTIONS)} (latest run of each, change against {default or "-"}):\n'
+        s += ' %-62s'%'options' + ''.join(' %28s'%n for n in names) + '\n'
+        for combination in sorted(history[key], key=lambda c: (c != default, c)):
+            s += ' %-62s'%combination
+            for name in names:
+                result = history[key][combination].get(name)
+                if result is None:
+                    s += ' %28s'%'-'
+                    continue
+                median, unit = self._median(result)
+                change = ''
+                if name in before and combination != default:
+                    base, base_unit = self._median(before[name])
+                    if base and unit == base_unit:
+                        change = ' (%+.1f%%)'%(100 * (median - base) / base)
+                s += ' %28s'%('%.3f %s%s'%(median, unit, change))
+            s += '\n'
+        self.output.info(s)
+
+    def _report_jpeg_throughput(self, results_file):
+        """ Show the JPEG throughput, to compare the jpeg_backend options """
+
+        with open(results_file) as f: results = json.load(f)['benchmarks']
+
+        s = '\nMRPT JPEG throughput (jpeg_backend=%s):\n'%self.deps_user_info['mrpt'].jpeg_backend
+        s += ' %-24s %12s %12s\n'%('benchmark', 'median ms', 'Mpixels/s')
+        for name in sorted(n for n in results if 'mpix_per_s' in results[n]):
+            s += ' %-24s %12.3f %12.1f\n'%(name, results[name]['median_ms'], results[name]['mpix_per_s'])
+        self.output.info(s)
+
+    @staticmethod
+    def _median(result):
+        """ Median and unit of a benchmark result, most are median_ms """
+
+        key = sorted(k for k in result if k.startswith('median_'))[0]
+        return result[key], key[len('median_'):]
+
+    @property
+    def _baseline_settings(self):
+        return [
+            self.deps_cpp_info['mrpt'].version,
+            str(self.settings.os), str(self.settings.arch),
+            f'{self.settings.compiler}-{self.settings.compiler.version}',
+            str(self.settings.build_type),
+        ]
+
+    @property
+    def _baseline_key(self):
+        """ Benchmarks are only comparable for the same MRPT version, settings and options """
+
+        return '/'.join(self._baseline_settings + [self.deps_user_info['mrpt'].benchmark_options])
+
+    @property
+    def _baseline_file(self):
+        """ MRPT_BENCH_BASELINE, kept out of the recipe's folder by default so that conan create doesn't modify it """
+
+        default = os.path.join(os.path.expanduser('~'), '.cache', 'conan-mrpt', 'benchmark_baseline.json')
+        return os.environ.get('MRPT_BENCH_BASELINE', default)
+
+    def _check_benchmarks(self, results_file):
+        """
+        Compare the benchmark results against the stored baseline, failing
+        if any benchmark's median is slower than the baseline by more than
+        MRPT_BENCH_THRESHOLD (a fraction, default 0.25.)  Results marked
+        report_only are shown but never fail.
+
+        The baseline (MRPT_BENCH_BASELINE, default
+        ~/.cache/conan-mrpt/benchmark_baseline.json, kept out of the recipe's
+        folder so that conan create doesn't modify it) holds one set of
+        results per MRPT version, settings and options.  A missing entry is
+        recorded from this run, and MRPT_BENCH_UPDATE_BASELINE=1 replaces an
+        existing one.
+        """
+
+        with open(results_file) as f: results = json.load(f)['benchmarks']
+
+        threshold = float(os.environ.get('MRPT_BENCH_THRESHOLD', 0.25))
+        baseline_file = self._baseline_file
+        baselines = {}
+        if os.path.exists(baseline_file):
+            with open(baseline_file) as f: baselines = json.load(f)
+
+        key = self._baseline_key
+        if key not in baselines or os.environ.get('MRPT_BENCH_UPDATE_BASELINE', '0') == '1':
+            self.output.info(f'Recording benchmark baseline {key} in {baseline_file}')
+            baselines[key] = results
+            if not os.path.isdir(os.path.dirname(os.path.abspath(baseline_file))):
+                os.makedirs(os.path.dirname(os.path.abspath(baseline_file)))
+            with open(baseline_file, 'w') as f: json.dump(baselines, f, indent=2, sort_keys=True)
+            return
+
+        s = f'\nMRPT benchmarks against baseline {key} (threshold +{threshold:.0%}):\n'
+        s += ' %-24s %14s %14s %-6s %8s\n'%('benchmark', 'baseline', 'median', 'unit', 'change')
+        regressions = []
+        for name in sorted(results):
+            median, unit = self._median(results[name])
+            if name not in baselines[key] or unit != self._median(baselines[key][name])[1]:
+                s += ' %-24s %14s %14.3f %-6s %8s\n'%(name, '-', median, unit, 'new')
+                continue
+            base, _ = self._median(baselines[key][name])
+            change = (median - base) / base if base else 0.0
+            if results[name].get('report_only'):
+                s += ' %-24s %14.3f %14.3f %-6s %+7.1f%% (reported only)\n'%(name, base, median, unit, 100 * change)
+                continue
+            s += ' %-24s %14.3f %14.3f %-6s %+7.1f%%%s\n'%(name, base, median, unit, 100 * change, ' REGRESSION' if change > threshold else '')
+            if change > threshold:
+                regressions.append(name)
+        self.output.info(s)
+
+        if regressions:
+            raise ConanException('MRPT benchmarks regressed by more than %.0f%%: %s'%(100 * threshold, ', '.join(regressions)))
+
+    def _report_build_times(self):
+        """
+        Compare the compile times MRPT recorded for the unity build and
+        precompiled header modes (latest build of each mode with the same
+        version and settings as this test.)
+        """
+
+        path = self.deps_user_info['mrpt'].build_times_file
+        if not os.path.exists(path):
+            self.output.info('No MRPT build time history at %s'%path)
+            return
+
+        with open(path) as f: history = json.load(f)
+
+        compiler = f'{self.settings.compiler} {self.settings.compiler.version}'
+        latest = {}
+        for e in history:
+            if e['version'] != self.deps_cpp_info['mrpt'].version: continue
+            if e['os'] != str(self.settings.os) or e['arch'] != str(self.settings.arch): continue
+            if e['compiler'] != compiler or e['build_type'] != str(self.settings.build_type): continue
+            latest[(e['shared'], e['unity_build'], e['precompiled_headers'])] = e
+
+        if not latest:
+            self.output.info('No MRPT build times recorded for these settings')
+            return
+
+        s = '\nMRPT compile times (latest build of each mode):\n'
+        s += ' %-7s %-6s %-5s %-8s %4s %9s %8s\n'%('shared', 'unity', 'pch', 'cache', 'jobs', 'seconds', 'speedup')
+        for key in sorted(latest, key=str):
+            e = latest[key]
+            plain = latest.get((e['shared'], False, 'none'))
+            speedup = '%.2fx'%(plain['seconds'] / e['seconds']) if plain and e['seconds'] else '-'
+            s += ' %-7s %-6s %-5s %-8s %4s %9.1f %8s\n'%(
+                e['shared'], e['unity_build'], e['precompiled_headers'], e['compiler_cache'], e['jobs'], e['seconds'], speedup
+            )
+        self.output.info(s)
+
+# vim: ts=4 sw=4 expandtab ffs=unix ft=python foldmethod=marker :
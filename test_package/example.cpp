@@ -0,0 +1,12 @@
+#include <iostream>
+
+#include <mrpt/poses/CPose3D.h>
+
+int main()
+{
+    const mrpt::poses::CPose3D a(1.0, 2.0, 3.0, 0.1, 0.2, 0.3);
+    const mrpt::poses::CPose3D b(0.5, -1.0, 0.2, -0.3, 0.0, 0.1);
+
+    std::cout << "a + b = " << (a + b) << std::endl;
+    return 0;
+}
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+"""
+Time the MRPTConfig.cmake rewriting (MrptConan._fixFindPackage) on the test
+fixtures:
+
+    python tests/benchmark_fix_find_package.py [repetitions]
+"""
+
+import os, sys, time, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from conftest import DATA, VERSIONS, load_recipe_module, make_recipe
+
+
+def main(repetitions):
+    module = load_recipe_module()
+    for version in VERSIONS:
+        conan_data = tempfile.mkdtemp()
+        recipe = make_recipe(module, version, conan_data)
+        with open(os.path.join(DATA, f'MRPTConfig-{version}.cmake')) as f:
+            data = f.read().replace('@CONAN_DATA@', conan_data)
+        src = os.path.join(conan_data, 'MRPTConfig.cmake')
+        dst = os.path.join(conan_data, 'out', 'MRPTConfig.cmake')
+        with open(src, 'w') as f: f.write(data)
+
+        times = []
+        for _ in range(repetitions):
+            start = time.perf_counter()
+            recipe._fixFindPackage(src=src, dst=dst)
+            times.append(time.perf_counter() - start)
+        times.sort()
+        print('MRPTConfig-%s.cmake: median %.3f ms, min %.3f ms (%d repetitions)'%(
+            version, 1000 * times[len(times) // 2], 1000 * times[0], repetitions
+        ))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+Replace a test fixture with the MRPTConfig.cmake of a real MRPT build, e.g.
+after conan create of each version the recipe builds:
+
+    python tests/capture_mrpt_config.py 1.5.6 ~/.conan/data/mrpt/1.5.6/ntc/stable
+
+That takes build/<id>/unix-install/MRPTConfig.cmake (MRPTConfig.cmake at the
+top of the build folder on Windows) from the recipe's folder in the local
+cache, writes it to data/MRPTConfig-<version>.cmake with the cache paths
+replaced like the fixtures, and writes what the recipe makes of it to
+data/MRPTConfig-<version>.expected.cmake.  Review the expected output by hand
+before committing it: from then on the golden test only shows that it
+doesn't change.
+"""
+
+import os, sys, glob, argparse, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from conftest import DATA, PACKAGE_ID, load_recipe_module, make_recipe
+
+
+def find_config(recipe_folder):
+    candidates = glob.glob(os.path.join(recipe_folder, 'build', '*', 'unix-install', 'MRPTConfig.cmake'))
+    candidates += glob.glob(os.path.join(recipe_folder, 'build', '*', 'MRPTConfig.cmake'))
+    if not candidates:
+        raise SystemExit(f'No MRPTConfig.cmake in the build folders of {recipe_folder}')
+    return max(candidates, key=os.path.getmtime)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('version', help='MRPT version of the build')
+    parser.add_argument('recipe_folder', help="The recipe's folder in the local cache, with build/, package/ and source/")
+    parser.add_argument('--config', help='MRPTConfig.cmake to capture, instead of the latest one in the build folders')
+    args = parser.parse_args()
+
+    recipe_folder = os.path.abspath(os.path.expanduser(args.recipe_folder))
+    config = args.config or find_config(recipe_folder)
+    with open(config) as f: data = f.read()
+
+    # The build/package folders of the captured build get the fixtures'
+    # package ID, the rules only care that they look like the local cache
+    package_ids = {os.path.basename(p) for p in glob.glob(os.path.join(recipe_folder, 'build', '*'))}
+    package_ids |= {os.path.basename(p) for p in glob.glob(os.path.join(recipe_folder, 'package', '*'))}
+    data = data.replace(recipe_folder, '@CONAN_DATA@')
+    for package_id in package_ids:
+        for kind in ['build', 'package']:
+            data = data.replace(f'@CONAN_DATA@/{kind}/{package_id}', f'@CONAN_DATA@/{kind}/{PACKAGE_ID}')
+
+    fixture = os.path.join(DATA, f'MRPTConfig-{args.version}.cmake')
+    with open(fixture, 'w') as f: f.write(data)
+    print(f'Captured {config} in {fixture}')
+
+    conan_data = tempfile.mkdtemp()
+    recipe = make_recipe(load_recipe_module(), args.version, conan_data)
+    src = os.path.join(conan_data, 'MRPTConfig.cmake')
+    dst = os.path.join(conan_data, 'out', 'MRPTConfig.cmake')
+    with open(src, 'w') as f: f.write(data.replace('@CONAN_DATA@', conan_data))
+    report = recipe._fixFindPackage(src=src, dst=dst)
+    with open(dst) as f: out = f.read().replace(conan_data, '@CONAN_DATA@')
+
+    expected = os.path.join(DATA, f'MRPTConfig-{args.version}.expected.cmake')
+    with open(expected, 'w') as f: f.write(out)
+    print(recipe.test_output.getvalue())
+    print('Rules applied: %s'%', '.join(f'{k}={v}' for k, v in sorted(report.items())))
+    print(f'Wrote {expected}, review it before committing')
+
+
+if __name__ == '__main__':
+    main()
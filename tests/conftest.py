@@ -0,0 +1,50 @@
+import os, io, importlib.util
+
+import pytest
+from conans.client.output import ConanOutput
+from conans.client.conf import get_default_settings_yml
+from conans.model.settings import Settings
+from conans.model.env_info import EnvValues
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA = os.path.join(ROOT, 'tests', 'data')
+
+# Package ID used in the paths of the MRPTConfig.cmake fixtures
+PACKAGE_ID = '5ab84d6acfe1f23c4fae0ab88f26e3a396351ac9'
+
+# Versions with a data/MRPTConfig-<version>.cmake fixture, i.e. every
+# version the recipe builds
+VERSIONS = ['1.2.2', '1.4.0', '1.5.5', '1.5.6']
+
+
+def load_recipe_module(path=os.path.join(ROOT, 'conanfile.py'), name='mrpt_conanfile'):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_recipe(module, version, conan_data):
+    """
+    An initialized MrptConan for version, with its folders laid out like the
+    local cache under conan_data (@CONAN_DATA@ in the fixtures)
+    """
+
+    output = io.StringIO()
+    recipe = module.MrptConan(ConanOutput(output), None, f'mrpt/{version}')
+    recipe.initialize(Settings.loads(get_default_settings_yml()), EnvValues())
+    recipe.version = version
+    recipe.folders.set_base_package(os.path.join(conan_data, 'package', PACKAGE_ID))
+    recipe.folders.set_base_source(os.path.join(conan_data, 'source'))
+    recipe.folders.set_base_build(os.path.join(conan_data, 'build', PACKAGE_ID))
+    recipe.test_output = output
+
+    # What MRPT installs, that the MRPTConfig.cmake fixes look for
+    os.makedirs(os.path.join(recipe.package_folder, 'include', 'mrpt', 'mrpt-config'))
+    return recipe
+
+
+@pytest.fixture(scope='session')
+def recipe_module():
+    return load_recipe_module()
@@ -0,0 +1,46 @@
+# =========================================================================
+#  The Mobile Robot Programming Toolkit (MRPT) CMake configuration file
+#
+#             ** File generated automatically, do not modify **
+#
+#  Usage from an external project:
+#    In your CMakeLists.txt, add these lines:
+#
+#    FIND_PACKAGE(MRPT REQUIRED slam)  # Replace "slam" by the list of libraries you need
+#    TARGET_LINK_LIBRARIES(MY_TARGET_NAME ${MRPT_LIBS})
+#
+# =========================================================================
+
+get_filename_component(THIS_MRPT_CONFIG_PATH "${CMAKE_CURRENT_LIST_FILE}" PATH)
+
+SET(MRPT_VERSION 1.5.6)
+SET(MRPT_VERSION_MAJOR 1)
+SET(MRPT_VERSION_MINOR 5)
+SET(MRPT_VERSION_PATCH 6)
+
+SET(MRPT_DIR "@CONAN_DATA@/package/5ab84d6acfe1f23c4fae0ab88f26e3a396351ac9")
+SET(MRPT_SOURCE_DIR "@CONAN_DATA@/source/mrpt")
+SET(MRPT_LIBS_INCL_DIR "@CONAN_DATA@/package/5ab84d6acfe1f23c4fae0ab88f26e3a396351ac9/mrpt/libs")
+SET(MRPT_CONFIG_DIR "@CONAN_DATA@/package/5ab84d6acfe1f23c4fae0ab88f26e3a396351ac9/include/mrpt-config/unix")
+
+# MRPT's own include directories and 3rd party dependencies:
+INCLUDE_DIRECTORIES("@CONAN_DATA@/eigen/3.3.4/ntc/stable/package/a61b6c6ce8be9f3c1c1a8a4cc1bb2ec2cb0c4b73/include/eigen3")
+INCLUDE_DIRECTORIES(${MRPT_CONFIG_DIR})
+LINK_DIRECTORIES("")
+INCLUDE_DIRECTORIES("/usr/include/suitesparse") # SuiteSparse_INCLUDE_DIRS
+
+SET(MRPT_LIBS "")
+FOREACH(MRPTLIB ${MRPT_FIND_COMPONENTS})
+	INCLUDE_DIRECTORIES("${MRPT_LIBS_INCL_DIR}/${MRPTLIB}/include")
+	LIST(APPEND MRPT_LIBS optimized mrpt-${MRPTLIB}156 debug mrpt-${MRPTLIB}156-dbg)
+ENDFOREACH()
+
+IF(wxWidgets_FOUND)
+	LINK_DIRECTORIES(${wxWidgets_LIBRARY_DIRS})
+ENDIF()
+
+LINK_DIRECTORIES("/lib")
+LINK_DIRECTORIES("/lib")
+LINK_DIRECTORIES(${MRPT_DIR}/lib)
+
+SET(MRPT_DATA_DIR "@CONAN_DATA@/package/5ab84d6acfe1f23c4fae0ab88f26e3a396351ac9/share/mrpt")
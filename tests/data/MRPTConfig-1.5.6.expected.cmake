@@ -0,0 +1,54 @@
+#
+# Note:  This file has been manually modified to not inject links/includes into
+# the global scope, and to instead define MRPT_LIBRARIES and MRPT_INCLUDE_DIRS
+# that can then be used by our OPAL_MRPT find script
+
+# =========================================================================
+#  The Mobile Robot Programming Toolkit (MRPT) CMake configuration file
+#
+#             ** File generated automatically, do not modify **
+#
+#  Usage from an external project:
+#    In your CMakeLists.txt, add these lines:
+#
+#    FIND_PACKAGE(MRPT REQUIRED slam)  # Replace "slam" by the list of libraries you need
+#    TARGET_LINK_LIBRARIES(MY_TARGET_NAME ${MRPT_LIBS})
+#
+# =========================================================================
+
+set(THIS_MRPT_CONFIG_PATH ${CONAN_MRPT_ROOT})
+
+SET(MRPT_VERSION 1.5.6)
+SET(MRPT_VERSION_MAJOR 1)
+SET(MRPT_VERSION_MINOR 5)
+SET(MRPT_VERSION_PATCH 6)
+
+SET(MRPT_DIR "${CONAN_MRPT_ROOT}")
+SET(MRPT_SOURCE_DIR "@CONAN_DATA@/source")
+SET(MRPT_LIBS_INCL_DIR "${CONAN_MRPT_ROOT}/libs")
+SET(MRPT_CONFIG_DIR "${CONAN_MRPT_ROOT}/include/mrpt/mrpt-config")
+
+# MRPT's own include directories and 3rd party dependencies:
+list(APPEND MRPT_INCLUDE_DIRS "${CONAN_INCLUDE_DIRS_EIGEN}")
+list(APPEND MRPT_INCLUDE_DIRS "${MRPT_CONFIG_DIR}")
+# LINK_DIRECTORIES("")
+list(APPEND MRPT_INCLUDE_DIRS "/usr/include/suitesparse") # SuiteSparse_INCLUDE_DIRS
+
+SET(MRPT_LIBS "")
+FOREACH(MRPTLIB ${MRPT_FIND_COMPONENTS})
+	list(APPEND MRPT_INCLUDE_DIRS "${MRPT_LIBS_INCL_DIR}/${MRPTLIB}/include")
+	LIST(APPEND MRPT_LIBS optimized mrpt-${MRPTLIB}156 debug mrpt-${MRPTLIB}156-dbg)
+ENDFOREACH()
+
+IF(wxWidgets_FOUND)
+	list(APPEND MRPT_INCLUDE_DIRS "${wxWidgets_LIBRARY_DIRS}")
+ENDIF()
+
+LINK_DIRECTORIES("/lib")
+list(APPEND MRPT_LINK_DIRECTORIES "${MRPT_DIR}/lib")
+
+SET(MRPT_DATA_DIR "${CONAN_MRPT_ROOT}/share/mrpt")
+
+
+# Defining for forward-compatiblity
+set(MRPT_LIBRARIES ${MRPT_LIBS})
\ No newline at end of file
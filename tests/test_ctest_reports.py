@@ -0,0 +1,64 @@
+"""
+Tests of the ctest log parsing and JUnit report (MrptConan._parse_ctest_log
+and MrptConan._write_junit)
+"""
+
+import xml.etree.ElementTree as ET
+
+
+# From ctest 3.25's --output-log, note the line break ctest puts before the
+# status of a test it couldn't run
+CTEST_LOG = '''Test project /tmp/mrpt/build
+
+    Start 1: test_mrpt_base
+    Start 2: test_mrpt_maps
+    Start 3: test_mrpt_slam
+    Start 4: test_mrpt_hwdrivers
+Unable to find executable: /tmp/mrpt/build/bin/test_mrpt_hwdrivers
+
+1/4 Test #4: test_mrpt_hwdrivers ..............
+***Not Run   0.00 sec
+2/4 Test #1: test_mrpt_base ...................   Passed    4.12 sec
+3/4 Test #2: test_mrpt_maps ...................***Failed    0.53 sec
+4/4 Test #3: test_mrpt_slam ...................***Timeout 600.01 sec
+
+25% tests passed, 3 tests failed out of 4
+
+Total Test time (real) = 600.02 sec
+
+The following tests FAILED:
+	  2 - test_mrpt_maps (Failed)
+	  3 - test_mrpt_slam (Timeout)
+	  4 - test_mrpt_hwdrivers (Not Run)
+'''
+
+
+def test_parse_ctest_log(recipe_module):
+    assert recipe_module.MrptConan._parse_ctest_log(CTEST_LOG) == [
+        {'number': 4, 'name': 'test_mrpt_hwdrivers', 'status': 'Not Run', 'seconds': 0.0},
+        {'number': 1, 'name': 'test_mrpt_base',      'status': 'Passed',  'seconds': 4.12},
+        {'number': 2, 'name': 'test_mrpt_maps',      'status': 'Failed',  'seconds': 0.53},
+        {'number': 3, 'name': 'test_mrpt_slam',      'status': 'Timeout', 'seconds': 600.01},
+    ]
+
+
+def test_parse_ctest_log_no_tests(recipe_module):
+    assert recipe_module.MrptConan._parse_ctest_log('Test project /tmp/mrpt/build\nNo tests were found!!!\n') == []
+
+
+def test_write_junit(recipe_module, tmp_path):
+    tests = recipe_module.MrptConan._parse_ctest_log(CTEST_LOG)
+    path = str(tmp_path / 'ctest.xml')
+    recipe_module.MrptConan._write_junit(path, tests, 600.02)
+
+    suite = ET.parse(path).getroot()
+    assert suite.tag == 'testsuite'
+    assert suite.attrib == {'name': 'mrpt', 'tests': '4', 'failures': '2', 'time': '600.020'}
+
+    cases = {c.get('name'): c for c in suite.findall('testcase')}
+    assert list(cases) == ['test_mrpt_hwdrivers', 'test_mrpt_base', 'test_mrpt_maps', 'test_mrpt_slam']
+    assert cases['test_mrpt_base'].get('time') == '4.120'
+    assert list(cases['test_mrpt_base']) == []
+    assert [e.tag for e in cases['test_mrpt_hwdrivers']] == ['skipped']
+    assert cases['test_mrpt_maps'].find('failure').get('message') == 'Failed'
+    assert cases['test_mrpt_slam'].find('failure').get('message') == 'Timeout'
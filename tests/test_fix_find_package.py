@@ -0,0 +1,69 @@
+"""
+Golden-file tests of the MRPTConfig.cmake rewriting (MrptConan._fixFindPackage)
+
+The fixtures in data/ have the local cache paths replaced by @CONAN_DATA@,
+the expected outputs (*.expected.cmake) are what the recipe produced before
+the rewrite rules were moved to FIND_PACKAGE_RULES.  The fixtures follow the
+layout of MRPT's MRPTConfig.cmake.in rather than coming from real builds,
+capture_mrpt_config.py replaces one with the MRPTConfig.cmake of a build.
+"""
+
+import os
+
+import pytest
+
+from conftest import DATA, VERSIONS, make_recipe
+
+
+def fix_find_package(recipe_module, version, tmp_path):
+    conan_data = str(tmp_path)
+    recipe = make_recipe(recipe_module, version, conan_data)
+
+    with open(os.path.join(DATA, f'MRPTConfig-{version}.cmake')) as f:
+        data = f.read().replace('@CONAN_DATA@', conan_data)
+    src = os.path.join(conan_data, 'MRPTConfig.cmake')
+    dst = os.path.join(conan_data, 'out', 'MRPTConfig.cmake')
+    with open(src, 'w') as f: f.write(data)
+
+    report = recipe._fixFindPackage(src=src, dst=dst)
+    with open(dst) as f:
+        return f.read().replace(conan_data, '@CONAN_DATA@'), report, recipe.test_output.getvalue()
+
+
+@pytest.mark.parametrize('version', VERSIONS)
+def test_golden(recipe_module, version, tmp_path):
+    out, _, _ = fix_find_package(recipe_module, version, tmp_path)
+    with open(os.path.join(DATA, f'MRPTConfig-{version}.expected.cmake')) as f:
+        assert out == f.read()
+
+
+@pytest.mark.parametrize('version', ['1.2.2', '1.4.0'])
+def test_fallback_paths_replaced_first(recipe_module, version, tmp_path):
+    # Without THIS_MRPT_CONFIG_PATH the build/package paths are replaced
+    # before the SET rules, which then have nothing left to fix
+    _, report, output = fix_find_package(recipe_module, version, tmp_path)
+    assert report['mrpt_dir_build'] == 3
+    assert report['mrpt_dir_package'] == 1
+    assert report['libs_incl_dir'] == 0
+    assert report['config_dir'] == 0
+    assert 'Could not repair MRPT_LIBS_INCL_DIR variable' in output
+
+
+@pytest.mark.parametrize('version', ['1.5.5', '1.5.6'])
+def test_report(recipe_module, version, tmp_path):
+    _, report, output = fix_find_package(recipe_module, version, tmp_path)
+    assert 'mrpt_dir_build' not in report
+    for rule in ['config_path', 'source_dir', 'libs_incl_dir', 'config_dir', 'mrpt_dir', 'eigen_include',
+                 'config_dir_include', 'empty_link_directories', 'suitesparse_include', 'mrpt_include',
+                 'wxwidgets_link', 'duplicate_lib_link', 'mrpt_link', 'package_folder']:
+        assert report[rule] == 1, rule
+    assert 'WARN' not in output
+
+
+def test_already_patched(recipe_module, tmp_path):
+    out, _, _ = fix_find_package(recipe_module, '1.5.6', tmp_path)
+    recipe = make_recipe(recipe_module, '1.5.6', str(tmp_path / 'again'))
+    src = str(tmp_path / 'patched.cmake')
+    with open(src, 'w') as f: f.write(out)
+    assert recipe._fixFindPackage(src=src, dst=str(tmp_path / 'unused.cmake')) is None
+    assert 'already patched' in recipe.test_output.getvalue()